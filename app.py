@@ -1,7 +1,6 @@
 from __future__ import annotations
 import time
 import streamlit as st
-from PIL import Image
 st.set_page_config(page_title="Ink Consumption — ml/m² & ROI Analyzer", page_icon="assets/app_logo.png", layout="wide")
 
 # -*- coding: utf-8 -*-
@@ -12,6 +11,7 @@ from pathlib import Path
 import tempfile
 import os, pathlib
 os.environ.setdefault("HOME", "/tmp")
+os.environ.setdefault("MPLBACKEND", "Agg")  # só exportamos PDF: sem autodetecção de backend GUI
 pathlib.Path(os.path.join(os.environ["HOME"], ".streamlit")).mkdir(parents=True, exist_ok=True)
 
 import importlib
@@ -21,24 +21,35 @@ import unicodedata
 def _deaccent(s: str) -> str:
     return unicodedata.normalize("NFKD", s or "").encode("ascii", "ignore").decode("ascii")
 
-import io, re, math, zipfile, warnings, datetime as dt, textwrap, hashlib, calendar
+import io, re, math, zipfile, datetime as dt, textwrap, hashlib, calendar
 import xml.etree.ElementTree as ET
-from typing import Any, Dict, Tuple, List, TYPE_CHECKING
+from typing import Any, Dict, Iterator, Mapping, Tuple, List, TYPE_CHECKING
+from functools import lru_cache
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from decimal import Decimal, ROUND_HALF_UP
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 import os as _os
 
 
 class _LazyModule(types.ModuleType):
     """Lazy loader that defers heavy imports until first attribute access."""
-    def __init__(self, module_name: str, attr_name: str | None = None):
+    def __init__(self, module_name: str, attr_name: str | None = None, on_load=None):
         super().__init__(module_name)
         self._module_name = module_name
         self._attr_name = attr_name
+        self._on_load = on_load
         self._module = None
 
     def _load(self):
         if self._module is None:
             module = importlib.import_module(self._module_name)
+            if self._on_load is not None:
+                self._on_load()
             if self._attr_name:
                 module = getattr(module, self._attr_name)
             self._module = module
@@ -56,31 +67,29 @@ class _LazyModule(types.ModuleType):
     def __call__(self, *args, **kwargs):
         return self._load()(*args, **kwargs)
 
-# Lazy heavy modules (resolved on demand)
-try:
-    import numpy as np  # type: ignore[import-not-found]
-except Exception:  # pragma: no cover - fallback for minimal environments
-    np = _LazyModule("numpy")
-try:
-    import pandas as pd  # type: ignore[import-not-found]
-except Exception:  # pragma: no cover
-    pd = _LazyModule("pandas")
-Image = _LazyModule("PIL.Image")
-ImageFile = _LazyModule("PIL.ImageFile")
-go = _LazyModule("plotly.graph_objects")
-plt = _LazyModule("matplotlib.pyplot")
-PdfPages = _LazyModule("matplotlib.backends.backend_pdf", "PdfPages")
-pio = _LazyModule("plotly.io")
+def _pillow_defaults():
+    # Pillow safety: aplicado no primeiro uso do PIL, antes de qualquer decode
+    from PIL import Image as _PILImage, ImageFile as _PILImageFile
+    _PILImage.MAX_IMAGE_PIXELS = None
+    _PILImageFile.LOAD_TRUNCATED_IMAGES = True
+
+def _plotly_defaults():
+    import plotly.io as _pio
+    _pio.templates.default = "plotly_white"   # base clara; gráficos específicos também usam "plotly_white"
+
+# Lazy heavy modules (resolved on demand) — numpy/pandas também só carregam no primeiro uso,
+# então fluxos leves (ex.: Sales — Quick quote) não pagam o import no cold start.
+np = _LazyModule("numpy")
+pd = _LazyModule("pandas")
+# PIL/plotly: os defaults globais rodam no on_load, não no import do app
+Image = _LazyModule("PIL.Image", on_load=_pillow_defaults)
+go = _LazyModule("plotly.graph_objects", on_load=_plotly_defaults)
 
 if TYPE_CHECKING:  # pragma: no cover - helps IDEs/type-checkers
     import numpy as np  # type: ignore[no-redef]
     import pandas as pd  # type: ignore[no-redef]
     from PIL import Image as Image  # type: ignore[no-redef]
-    from PIL import ImageFile as ImageFile  # type: ignore[no-redef]
     import plotly.graph_objects as go  # type: ignore[no-redef]
-    import matplotlib.pyplot as plt  # type: ignore[no-redef]
-    from matplotlib.backends.backend_pdf import PdfPages  # type: ignore[no-redef]
-    import plotly.io as pio  # type: ignore[no-redef]
     from PIL.Image import Image as PILImageType
 else:
     PILImageType = Any  # type: ignore[assignment]
@@ -89,14 +98,28 @@ fragment_decorator = getattr(st, "fragment", None)
 if fragment_decorator is None:
     fragment_decorator = getattr(st, "experimental_fragment", None)
 
-pio.templates.default = "plotly_white"   # base clara; gráficos específicos também usam "plotly_white"
-
 # ---------------- Config & CSS (light, professional theme) ----------------
+@lru_cache(maxsize=1)
+def _asset_entries() -> Dict[str, str]:
+    # Uma única listagem de assets/ substitui um stat por extensão testada
+    try:
+        with _os.scandir("assets") as it:
+            return {e.name: e.path for e in it if e.is_file()}
+    except OSError:
+        return {}
+
+@st.cache_resource(show_spinner=False)
 def _load_asset_image(basename: str):
+    # Resolvido uma vez por processo: lê os bytes e decodifica já (sem reabrir o arquivo a cada rerun)
+    entries = _asset_entries()
     for ext in (".png", ".jpg", ".jpeg", ".webp"):
-        path = f"assets/{basename}{ext}"
+        path = entries.get(f"{basename}{ext}")
+        if path is None:
+            continue
         try:
-            return Image.open(path)
+            im = Image.open(io.BytesIO(Path(path).read_bytes()))
+            im.load()
+            return im
         except Exception:
             continue
     return None
@@ -107,12 +130,9 @@ DEFAULT_APP_TITLE = "Ink Consumption — ml/m² & ROI Analyzer"
 DEFAULT_APP_SUBTITLE = "ml/m², pixels, costs and A×B comparisons"
 # ---------- Fast/Safe boot block ----------
 SAFE_MODE = (_os.getenv("INK_SAFE", "1") != "0")
-try:
-    _toggle_val = st.session_state.get("SAFE_MODE_TOGGLE", SAFE_MODE)
-    _toggle_val = st.sidebar.toggle("⚡ Fast/Safe mode (abrir leve)", value=_toggle_val, key="SAFE_MODE_TOGGLE")
-    SAFE_MODE = bool(_toggle_val)
-except Exception:
-    pass
+# O widget persiste o próprio valor pela key; só semeamos o default uma vez
+st.session_state.setdefault("SAFE_MODE_TOGGLE", SAFE_MODE)
+SAFE_MODE = bool(st.sidebar.toggle("⚡ Fast/Safe mode (abrir leve)", key="SAFE_MODE_TOGGLE"))
 
 def safe_section(title, fn):
     try:
@@ -123,20 +143,17 @@ def safe_section(title, fn):
         if st.checkbox(f"Mostrar detalhes ({title})", key=f"tb_{title}"):
             st.exception(e)
 
-def _mpl():
-    import matplotlib.pyplot as plt
+@lru_cache(maxsize=1)
+def _pdfpages():
+    # matplotlib só é importado no primeiro export de PDF; o font manager é montado junto, uma vez
     from matplotlib.backends.backend_pdf import PdfPages
-    return plt, PdfPages
+    import matplotlib.font_manager as fm
+    fm.fontManager  # noqa: B018 — força a carga do cache de fontes aqui, não no primeiro texto
+    return PdfPages
 # ---------- End fast/safe block ----------
 
-# Pillow safety
-Image.MAX_IMAGE_PIXELS = None
-ImageFile.LOAD_TRUNCATED_IMAGES = True
-warnings.simplefilter("ignore", Image.DecompressionBombWarning)
-
 # ======= THEME: LIGHT PROFESSIONAL (background), dark texts, soft contrast.
-st.markdown("""
-<style>
+_CSS_MAIN = """
 :root{
   --ink-bg: #f6f8fc; /* App background: very light gray */
   --ink-panel: #f3f4f6; /* Cards/panels: light gray */
@@ -489,12 +506,10 @@ div[role="switch"] > div > div{
 .chan-swatch .label{ text-align:center; font-size:12px; color:var(--ink-muted); margin-top:4px; }
 
 .ink-row-spacer{ height: 96px; }
+.ink-sep{ border-top:1px solid #e8edf7; margin:8px 0; }
+"""
 
-</style>
-""", unsafe_allow_html=True)
-
-st.markdown("""
-<style>
+_CSS_GRID = """
 /* === Compare A×B — Fixed allocation row alignment (Jobs A & B) === */
 .ink-fixed-grid [data-testid="stNumberInput"] label,
 .ink-fixed-grid [data-testid="stNumberInput"] label * ,
@@ -535,37 +550,67 @@ st.markdown("""
   min-height: 22px !important;
   display: block !important;
 }
-</style>
-""", unsafe_allow_html=True)
+"""
+
+
+def _minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,])\s*", r"\1", css).strip()
+
+
+# Minificado uma vez no import; um único bloco <style> por rerun
+_CSS_MIN = _minify_css(_CSS_MAIN) + _minify_css(_CSS_GRID)
+
+# CSS já enviado neste run. O Streamlit reexecuta o script a cada interação e descarta
+# elementos que não foram reemitidos, então o <style> precisa sair uma vez POR RUN
+# (um sentinel por sessão faria o tema sumir no rerun seguinte); só repetições são evitadas.
+_STYLE_SENT: set = set()
+
+
+def _inject_style_once(sig: tuple, build) -> None:
+    """Emit the CSS returned by build() unless the same signature was already sent in this run."""
+    if sig in _STYLE_SENT:
+        return
+    _STYLE_SENT.add(sig)
+    css = build()
+    if css:
+        st.markdown(css, unsafe_allow_html=True)
+
+
+_inject_style_once(("theme",), lambda: f"<style>{_CSS_MIN}</style>")
+
 
 # =========================
 # Constantes & defaults
 # =========================
-DEFAULTS = {
-    "ink_color_per_l": 70.00,
-    "ink_white_per_l": 85.00,
-    "fof_per_l": 60.00,         # Fixation / Duo Soft per L
-    "fabric_per_unit": 3.50,    # por m² (ou por m em modo linear)
+@dataclass(frozen=True, slots=True)
+class Defaults:
+    ink_color_per_l: float = 70.00
+    ink_white_per_l: float = 85.00
+    fof_per_l: float = 60.00         # Fixation / Duo Soft per L
+    fabric_per_unit: float = 3.50    # por m² (ou por m em modo linear)
     # fixed (monthly) & production
-    "fix_labor_month": 0.0,
-    "fix_leasing_month": 0.0,
-    "fix_capex_month": 0.0,
-    "fix_indust_month": 0.0,
-    "prod_month_units": 30800.0,
+    fix_labor_month: float = 0.0
+    fix_leasing_month: float = 0.0
+    fix_capex_month: float = 0.0
+    fix_indust_month: float = 0.0
+    prod_month_units: float = 30800.0
     # moeda
-    "local_symbol": "R$",
-    "usd_to_local": 5.57,
+    local_symbol: str = "R$"
+    usd_to_local: float = 5.57
     # payback defaults
-    "payback_machine_investment": 150000.0,
-    "payback_residual_value": 0.0,
-    "payback_ramp_months": 3,
-    "payback_ramp_start_pct": 40.0,
-    "payback_growth_pct": 0.0,
-    "payback_horizon_months": 36,
-}
+    payback_machine_investment: float = 150000.0
+    payback_residual_value: float = 0.0
+    payback_ramp_months: int = 3
+    payback_ramp_start_pct: float = 40.0
+    payback_growth_pct: float = 0.0
+    payback_horizon_months: int = 36
+
+DEFAULTS = Defaults()
 
 # Modos de impressão (velocidade em m²/h; m/h ≈ m²/h ÷ largura)
-PRINT_MODES: Dict[str, Dict[str, object]] = {
+PRINT_MODES: Mapping[str, Mapping[str, object]] = {
     "Fast Quality":         {"speed": 270, "res_color": "800×400"},
     "Fast Production":      {"speed": 475, "res_color": "800×400"},
     "Standard Quality":     {"speed": 180, "res_color": "600×800"},
@@ -581,6 +626,15 @@ MODE_GROUP = {
 }
 CHANNELS_WHITE = {"white","w"}
 CHANNELS_FOF   = {"fof","f","fix","fixation","pretreat","pre_treat","duosoft","softener","fixacao","fixacaofof"}
+# Classe do canal (nome em minúsculas) → 0=color, 1=white, 2=fof; ausente = color
+CHANNEL_CLASS: Mapping[str, int] = types.MappingProxyType(
+    {name: cls for names, cls in ((CHANNELS_WHITE, 1), (CHANNELS_FOF, 2)) for name in names}
+)
+
+@lru_cache(maxsize=256)
+def channel_class(key: str) -> int:
+    """Class of a channel key (0=color, 1=white, 2=fof); strip/lower happen once per distinct key."""
+    return CHANNEL_CLASS.get((key or "").strip().lower(), 0)
 CHANNEL_COLORS = {
     "Cyan":"#00B7EB","Magenta":"#FF00A8","Yellow":"#FFD300",
     "Black":"#222222","Red":"#E53935","Green":"#43A047",
@@ -611,42 +665,127 @@ BORDER_COLORS = {
     "White":   "#d0d5dd",
 }
 
+# Tabelas só de leitura: congeladas (MappingProxyType) + forma derivada pré-computada
+PRINT_MODES = types.MappingProxyType({k: types.MappingProxyType(v) for k, v in PRINT_MODES.items()})
+MODE_GROUP = types.MappingProxyType(MODE_GROUP)
+CHANNEL_COLORS = types.MappingProxyType(CHANNEL_COLORS)
+LIGHT_CHANNEL_BG = types.MappingProxyType(LIGHT_CHANNEL_BG)
+BORDER_COLORS = types.MappingProxyType(BORDER_COLORS)
+@dataclass(frozen=True, slots=True)
+class PrintMode:
+    name: str
+    speed: int
+    res_color: str
+    group: str
+
+# Na ordem de PRINT_MODES (o mapping continua sendo a fonte para lookups por nome)
+MODES: Tuple[PrintMode, ...] = tuple(
+    PrintMode(name, int(m["speed"]), str(m["res_color"]), MODE_GROUP[name]) for name, m in PRINT_MODES.items()
+)
+DEFAULT_PRINT_MODE = MODES[0].name if MODES else None
+# Lookups planos para os labels de modo (sem PRINT_MODES[k][campo] a cada chamada)
+_MODE_RES_COLOR: Mapping[str, str] = types.MappingProxyType({k: v["res_color"] for k, v in PRINT_MODES.items()})
+_MODE_SPEED: Mapping[str, float] = types.MappingProxyType({k: v["speed"] for k, v in PRINT_MODES.items()})
+
 # =========================
 # Pequenos helpers de UI
 # =========================
-def section(title: str, subtitle: str|None=None):
-    st.markdown(f"""
+@lru_cache(maxsize=128)
+def _section_html(title: str, subtitle: str|None) -> str:
+    return f"""
 <div class="section-card">
   <h3 class="section-title">{title}</h3>
   {f"<small class='section-subtitle'>{subtitle}</small>" if subtitle else ""}
 </div>
-""", unsafe_allow_html=True)
+"""
+
+def section(title: str, subtitle: str|None=None):
+    if not title and not subtitle:
+        return
+    st.markdown(_section_html(title, subtitle), unsafe_allow_html=True)
+
+def _missing_col_default(c):
+    return 0.0 if any(tok in str(c).lower() for tok in ("value","usd","price")) else ""
 
 def ensure_df(obj, cols=None):
-    if isinstance(obj, pd.DataFrame): df = obj.copy()
-    elif isinstance(obj, (list, tuple)): df = pd.DataFrame(list(obj))
+    # Sem cópia: os chamadores só leem o resultado (to_dict / soma / data_editor)
+    if isinstance(obj, pd.DataFrame):
+        if not cols or list(obj.columns) == list(cols):
+            return obj
+        df = obj
+    elif isinstance(obj, (list, tuple)): df = pd.DataFrame.from_records(list(obj))
     elif isinstance(obj, dict): df = pd.DataFrame([obj])
     else: df = pd.DataFrame()
     if cols:
-        for c in cols:
-            if c not in df.columns:
-                is_num_hint = any(tok in str(c).lower() for tok in ("value","usd","price"))
-                df[c] = 0.0 if is_num_hint else ""
-        df = df[cols]
+        missing = [c for c in cols if c not in df.columns]
+        if missing:
+            df = df.assign(**{c: _missing_col_default(c) for c in missing})
+        df = df[list(cols)]
     return df
 
-from decimal import Decimal, ROUND_HALF_UP
+def _sum_value_column(obj, col: str = "Value") -> float:
+    """Sum one column of a small editor table (DataFrame, list of dicts or dict); NaN/blank count as 0."""
+    if isinstance(obj, dict):
+        vals = [obj.get(col)]
+    elif isinstance(obj, (list, tuple)):
+        vals = [row.get(col) for row in obj if isinstance(row, dict)]
+    elif isinstance(obj, pd.DataFrame) and col in obj.columns:
+        vals = obj[col].tolist()
+    else:
+        return 0.0
+    parts = []
+    for v in vals:
+        try:
+            f = float(v or 0.0)
+        except (TypeError, ValueError):
+            continue
+        if f == f:  # NaN
+            parts.append(f)
+    return math.fsum(parts)
 
+_DEC_ONE = Decimal("1")
+
+@lru_cache(maxsize=16)
+def _decimal_step(step: float) -> Decimal:
+    # passos típicos: 0.01 / 0.05 / 0.10
+    return Decimal(str(step))
+
+_FLOAT_STEPS = (0.01, 0.02, 0.05, 0.10)
+
+@lru_cache(maxsize=4096)
 def price_round(v: float, step: float = 0.05) -> float:
     if step <= 0: step = 0.01
-    q = Decimal(str(step))
-    return float((Decimal(str(v)) / q).quantize(Decimal("1"), rounding=ROUND_HALF_UP) * q)
+    if not math.isfinite(v): return v  # NaN/±inf passam direto (math.floor não aceita)
+    if step in _FLOAT_STEPS:
+        # half-up (afastando do zero, como ROUND_HALF_UP); o epsilon absorve 1.225/0.05 = 24.4999…
+        n = math.floor(abs(v) / step + 0.5 + 1e-9)
+        return round(math.copysign(n * step, v), 10)
+    q = _decimal_step(step)
+    return float((Decimal(str(v)) / q).quantize(_DEC_ONE, rounding=ROUND_HALF_UP) * q)
+
+@lru_cache(maxsize=1024)
+def _suggest_price(cost_unit: float, margin: float, tax: float, terms: float, rnd: float) -> float:
+    """Suggested price: cost + margin + taxes, rounded, then + terms, rounded again."""
+    p = price_round(cost_unit * (1 + margin / 100 + tax / 100), rnd)
+    return price_round(p * (1 + terms / 100), rnd)
+
+_FMT = "{:,.2f}".format
+
+@lru_cache(maxsize=4096)
+def _fmt_money(val_scaled: float, symbol: str) -> str:
+    return f"{symbol} {_FMT(val_scaled)}"
 
 def pretty_money(v, symbol="US$", fx=1.0) -> str:
-    try: val = float(v)
-    except Exception: val = 0.0
-    val *= (fx or 1.0)
-    return f"{symbol} {val:,.2f}"
+    if isinstance(v, float): val = v
+    else:
+        try: val = float(v)
+        except Exception: val = 0.0
+    return _fmt_money(val * (fx or 1.0), str(symbol))
+
+def pretty_money_many(values, symbol="US$", fx=1.0) -> List[str]:
+    """pretty_money for a batch of floats: symbol/fx resolved once."""
+    f, s = (fx or 1.0), str(symbol)
+    return [_fmt_money(float(v) * f, s) for v in values]
 
 def unit_label_short(unit_mode:str) -> str:
     return "m²" if unit_mode=="m2" else "m"
@@ -682,15 +821,26 @@ def speed_label(unit_mode: str, speed_m2h: float, width_m: float) -> str:
     m_per_h = m2_per_h / max(1e-9, float(width_m or st.session_state.get("global_linear_width", 1.0)))
     return f"{m_per_h:.0f} m/h (≈ {m2_per_h:.0f} m²/h)"
 
-from contextlib import contextmanager
+@lru_cache(maxsize=32)
+def _div_tags(class_name: str) -> Tuple[str, str]:
+    return (f'<div class="{class_name}">', '</div>')
+
+# Profundidade de st_div por classe neste run (wrapper idêntico aninhado não reemite as tags)
+_DIV_DEPTH: Dict[str, int] = {}
 
 @contextmanager
 def st_div(class_name: str):
-    st.markdown(f'<div class="{class_name}">', unsafe_allow_html=True)
+    depth = _DIV_DEPTH.get(class_name, 0)
+    open_tag, close_tag = _div_tags(class_name)
+    if not depth:
+        st.markdown(open_tag, unsafe_allow_html=True)
+    _DIV_DEPTH[class_name] = depth + 1
     try:
         yield
     finally:
-        st.markdown('</div>', unsafe_allow_html=True)
+        _DIV_DEPTH[class_name] = depth
+        if not depth:
+            st.markdown(close_tag, unsafe_allow_html=True)
 
 
 class _FormOrLiveFlag:
@@ -792,7 +942,7 @@ def style_button_by_key(key: str, bg: str, fg: str = "#ffffff", border: str = "t
     div[id="{key}"] button:hover {{ filter: brightness(0.98); }}
     </style>
     """
-    st.markdown(css, unsafe_allow_html=True)
+    _inject_style_once(("btn_key", key, bg, fg, border), lambda: css)
 
 # ---- Helper: inject CSS for channel buttons (by aria-label)
 def style_channel_buttons_by_aria(display_to_label: Dict[str, str], selected_display: str | None = None):
@@ -800,63 +950,75 @@ def style_channel_buttons_by_aria(display_to_label: Dict[str, str], selected_dis
     display_to_label: map 'display text' -> 'canonical channel' (e.g., 'FOF (DuoSoft)' -> 'FOF').
     selected_display: display text of the currently selected button (to highlight).
     """
-    rules = []
-    for disp, lab in (display_to_label or {}).items():
-        bg = LIGHT_CHANNEL_BG.get(lab, "var(--ink-chip)")
-        border = BORDER_COLORS.get(lab, "var(--ink-edge)")
-        rules.append(
-            f'''
-            div[data-testid="stButton"] > button[aria-label="{disp}"] {{
-                background: {bg} !important;
-                color: var(--ink-text) !important;
-                border: 1px solid {border} !important;
-                border-radius: 10px !important;
-                padding: 10px 14px !important;
-            }}
-            div[data-testid="stButton"] > button[aria-label="{disp}"]:hover {{
-                filter: brightness(0.98);
-            }}
-            '''
-        )
+    sig = ("chan_aria", tuple((display_to_label or {}).items()), selected_display)
+    _inject_style_once(sig, lambda: _channel_buttons_css(display_to_label, selected_display))
+
+
+_CHAN_BTN_SEL = 'div[data-testid="stButton"] > button[aria-label="%s"]'
+# Template montado uma vez no import; por canal só resta um %-format
+_CHAN_RULE_CSS = (
+    _CHAN_BTN_SEL + "{background:%s !important;color:var(--ink-text) !important;"
+    "border:1px solid %s !important;border-radius:10px !important;padding:10px 14px !important;}"
+    + _CHAN_BTN_SEL + ":hover{filter:brightness(0.98);}"
+)
+_CHAN_SEL_CSS = _CHAN_BTN_SEL + "{box-shadow:0 0 0 2px var(--ink-accent) inset !important;}"
+
+
+def _channel_buttons_css(display_to_label: Dict[str, str], selected_display: str | None) -> str:
+    css = "".join(
+        _CHAN_RULE_CSS % (disp, LIGHT_CHANNEL_BG.get(lab, "var(--ink-chip)"), BORDER_COLORS.get(lab, "var(--ink-edge)"), disp)
+        for disp, lab in (display_to_label or {}).items()
+    )
     if selected_display:
-        rules.append(
-            f'''
-            div[data-testid="stButton"] > button[aria-label="{selected_display}"] {{
-                box-shadow: 0 0 0 2px var(--ink-accent) inset !important;
-            }}
-            '''
-        )
-    if rules:
-        st.markdown("<style>" + "\n".join(rules) + "</style>", unsafe_allow_html=True)
+        css += _CHAN_SEL_CSS % selected_display
+    return f"<style>{css}</style>" if css else ""
 
 # ---- Helper: render compact info tables (alternative to st.metric)
-from typing import List, Tuple
+_INFO_ROW_FMT = '<tr{cls}><td>{label}</td><td>{value}</td></tr>'.format
+_INFO_TABLE_HTML = (
+    '<div class="info-card"><div class="title">%s</div>'
+    '<table><thead><tr><th>Item</th><th>Value</th></tr></thead><tbody>%s</tbody></table></div>'
+)
+
 def render_info_table(title: str, rows: List[Tuple[str, str, bool]]):
     """Render a small card with a 2-column table (Item / Value).
     rows: list of tuples (label, formatted_value, emphasized_bool)
     """
-    parts = [
-        f'<div class="info-card"><div class="title">{title}</div>',
-        '<table><thead><tr><th>Item</th><th>Value</th></tr></thead><tbody>'
-    ]
-    for label, value, emph in (rows or []):
-        cls = ' class="emph"' if emph else ''
-        parts.append(f'<tr{cls}><td>{label}</td><td>{value}</td></tr>')
-    parts.append('</tbody></table></div>')
-    st.markdown("".join(parts), unsafe_allow_html=True)
+    body = "".join(
+        _INFO_ROW_FMT(cls=' class="emph"' if emph else '', label=label, value=value)
+        for label, value, emph in (rows or ())
+    )
+    st.markdown(_INFO_TABLE_HTML % (title, body), unsafe_allow_html=True)
 
 # =========================
 # Gráfico de Break-even (Plotly)
 # =========================
-@st.cache_data(show_spinner=False)
 def breakeven_figure(price_u: float, variable_u: float, fixed_month: float,
                      unit_lbl: str, sym: str, fx: float, title: str = "Break-even"):
     if price_u <= 0 or price_u <= variable_u or fixed_month <= 0:
-        fig = go.Figure()
-        fig.update_layout(template="plotly_white", height=360,
-                          title=f"{title} — fill in price, variable cost and monthly fixed cost.",
-                          margin=dict(l=10, r=10, t=50, b=10))
-        return fig
+        return _empty_breakeven_figure(f"{title} — fill in price, variable cost and monthly fixed cost.")
+    # Entradas arredondadas → chave de cache estável entre reruns sem mudança real
+    return _breakeven_figure_cached(
+        round(float(price_u or 0.0), 4), round(float(variable_u or 0.0), 4),
+        round(float(fixed_month or 0.0), 2), str(unit_lbl), str(sym),
+        round(float(fx or 1.0), 4), str(title),
+    )
+
+# Figura vazia compartilhada por título (entradas inválidas não reconstroem o Plotly a cada rerun)
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _empty_breakeven_figure(title: str):
+    fig = go.Figure()
+    fig.update_layout(template="plotly_white", height=360, title=title,
+                      margin=dict(l=10, r=10, t=50, b=10))
+    return fig
+
+# cache_resource: a Figure é reutilizada como está (sem pickle/cópia a cada hit); só é lida pelo st.plotly_chart
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _breakeven_figure_cached(price_u: float, variable_u: float, fixed_month: float,
+                             unit_lbl: str, sym: str, fx: float, title: str):
+    if price_u <= 0 or price_u <= variable_u or fixed_month <= 0:
+        # o arredondamento da chave pode zerar a margem
+        return _empty_breakeven_figure(f"{title} — fill in price, variable cost and monthly fixed cost.")
     # Build full BE chart
     try:
         p = float(price_u or 0.0) * float(fx or 1.0)
@@ -868,9 +1030,10 @@ def breakeven_figure(price_u: float, variable_u: float, fixed_month: float,
         else:
             buffer = max(10.0, be_units * 0.15)
             q_max = min(be_units + buffer, be_units * 4.0, 2_000_000.0)
-        x = np.linspace(0, q_max, 80)
-        revenue = p * x
-        total_cost = f + v * x
+        # Retas: dois pontos bastam (sem linspace/arrays intermediários)
+        x = [0.0, q_max]
+        revenue = [0.0, p * q_max]
+        total_cost = [f, f + v * q_max]
         fig = go.Figure()
         fig.add_trace(go.Scatter(x=x, y=revenue, mode="lines", name="Revenue"))
         fig.add_trace(go.Scatter(x=x, y=total_cost, mode="lines", name="Total cost"))
@@ -883,11 +1046,7 @@ def breakeven_figure(price_u: float, variable_u: float, fixed_month: float,
                           margin=dict(l=10, r=10, t=50, b=10), legend_title=None)
         return fig
     except Exception:
-        fig = go.Figure()
-        fig.update_layout(template="plotly_white", height=360,
-                          title=f"{title} — unavailable (invalid inputs).",
-                          margin=dict(l=10, r=10, t=50, b=10))
-        return fig
+        return _empty_breakeven_figure(f"{title} — unavailable (invalid inputs).")
 
 
 def render_break_even_insights(price_u: float, variable_u: float, fixed_month: float,
@@ -1030,7 +1189,7 @@ def render_payback_block(
         "Project when the machine investment is recovered with current unit economics.",
     )
 
-    steady_default_units = float(default_monthly_units or DEFAULTS.get("prod_month_units", 30800.0))
+    steady_default_units = float(default_monthly_units or DEFAULTS.prod_month_units)
     steady_default_fixed = float(default_fixed_month or (fixed_per_unit or 0.0) * steady_default_units)
     steady_default_depr = float(default_depreciation_month or 0.0)
 
@@ -1080,14 +1239,14 @@ def render_payback_block(
         machine_investment = st.number_input(
             "Machine investment (USD)",
             min_value=0.0,
-            value=float(st.session_state.get(f"{workflow_key}_payback_investment", DEFAULTS.get("payback_machine_investment", 150000.0))),
+            value=float(st.session_state.get(f"{workflow_key}_payback_investment", DEFAULTS.payback_machine_investment)),
             step=5000.0,
             key=f"{workflow_key}_payback_investment",
         )
         residual_value = st.number_input(
             "Residual value (USD)",
             min_value=0.0,
-            value=float(st.session_state.get(f"{workflow_key}_payback_residual", DEFAULTS.get("payback_residual_value", 0.0))),
+            value=float(st.session_state.get(f"{workflow_key}_payback_residual", DEFAULTS.payback_residual_value)),
             step=1000.0,
             key=f"{workflow_key}_payback_residual",
         )
@@ -1095,14 +1254,14 @@ def render_payback_block(
             "Ramp-up months",
             0,
             24,
-            value=int(st.session_state.get(f"{workflow_key}_payback_ramp_months", DEFAULTS.get("payback_ramp_months", 3))),
+            value=int(st.session_state.get(f"{workflow_key}_payback_ramp_months", DEFAULTS.payback_ramp_months)),
             key=f"{workflow_key}_payback_ramp_months",
         )
         ramp_start_pct = st.slider(
             "Ramp start (%)",
             0,
             100,
-            value=int(st.session_state.get(f"{workflow_key}_payback_ramp_start", DEFAULTS.get("payback_ramp_start_pct", 40.0))),
+            value=int(st.session_state.get(f"{workflow_key}_payback_ramp_start", DEFAULTS.payback_ramp_start_pct)),
             key=f"{workflow_key}_payback_ramp_start",
             help="Expected utilisation in month 1 (scales linearly until full volume at the end of ramp).",
         )
@@ -1110,7 +1269,7 @@ def render_payback_block(
             "Monthly growth after ramp (%)",
             min_value=-50.0,
             max_value=200.0,
-            value=float(st.session_state.get(f"{workflow_key}_payback_growth", DEFAULTS.get("payback_growth_pct", 0.0))),
+            value=float(st.session_state.get(f"{workflow_key}_payback_growth", DEFAULTS.payback_growth_pct)),
             step=0.5,
             key=f"{workflow_key}_payback_growth",
         )
@@ -1118,7 +1277,7 @@ def render_payback_block(
             "Analysis horizon (months)",
             6,
             120,
-            value=int(st.session_state.get(f"{workflow_key}_payback_horizon", DEFAULTS.get("payback_horizon_months", 36))),
+            value=int(st.session_state.get(f"{workflow_key}_payback_horizon", DEFAULTS.payback_horizon_months)),
             key=f"{workflow_key}_payback_horizon",
         )
 
@@ -1233,6 +1392,91 @@ def render_payback_block(
 # =========================
 # Sales — Quick quote (manual consumption)
 # =========================
+_SEP_HTML = '<div class="ink-sep"></div>'
+_SALES_FIX_MONTH_COLS = ("Labor (monthly)", "Leasing/Rent (monthly)", "Depreciation (monthly)", "Overheads (monthly)")
+
+@fragment_decorator if fragment_decorator else (lambda fn: fn)
+def _sales_results_fragment():
+    last = st.session_state.get("sales_last_res")
+    if not last:
+        return
+    unit_lbl = last["unit_lbl"]
+    sym_out, fx_out = last["sym"], last["fx"]
+
+    st.markdown(_SEP_HTML, unsafe_allow_html=True)
+    st.subheader("Quote result")
+    left, right = st.columns(2)
+    with left:
+        render_info_table("Total ($)", last["rows_tot"])
+    with right:
+        render_info_table(f"Per unit (/{unit_lbl})", last["rows_unit"])
+    render_help_glossary()
+
+    fig_be = breakeven_figure(
+        price_u=last["price"],
+        variable_u=last["variable_u"],
+        fixed_month=last["fixed_month"],
+        unit_lbl=unit_lbl,
+        sym=sym_out,
+        fx=fx_out,
+        title="Break-even — Quick quote",
+    )
+    st.plotly_chart(fig_be, use_container_width=True, key="sales_be_chart", config=plotly_cfg())
+    try:
+        render_break_even_insights(last["price"], last["variable_u"], last["fixed_month"], unit_lbl, sym_out, fx_out, label="Quote")
+    except Exception:
+        pass
+
+    render_payback_block(
+        "sales",
+        "Sales workflow",
+        price_per_unit=last["price"],
+        variable_per_unit=last["variable_u"],
+        fixed_per_unit=last["fixed_u"],
+        default_monthly_units=last["monthly_units_pay"],
+        default_fixed_month=last["fixed_month_pay"],
+        default_depreciation_month=last["depreciation_pay"],
+        sym=sym_out,
+        fx=fx_out,
+        unit_lbl=unit_lbl,
+    )
+
+    st.markdown(_SEP_HTML, unsafe_allow_html=True)
+    show_charts = st.checkbox("Show cost charts", value=True, key="sales_show_cost_charts")
+    if show_charts:
+        fxv = fx_out
+        color_u, white_u, fof_u = last["color_u"], last["white_u"], last["fof_u"]
+        fabric_u = last["fabric_u"]
+        fixed_u = last["fixed_u"]
+
+        y_title = f"{sym_out} / {unit_lbl}"
+        figs = st.session_state.get("sales_figs")
+        if figs is None:
+            fig_vf = go.Figure()
+            fig_vf.add_trace(go.Bar(name="Variable", x=["Per unit"], y=[0.0], marker_color="#3b82f6"))
+            fig_vf.add_trace(go.Bar(name="Fixed", x=["Per unit"], y=[0.0], marker_color="#9ca3af"))
+            fig_vf.update_layout(barmode="stack", template="plotly_white", height=320, margin=dict(l=10, r=10, t=30, b=10))
+
+            fig_var = go.Figure()
+            fig_var.add_trace(go.Bar(name="Breakdown", x=["Color ink", "White ink", "FOF / Pretreat", "Fabric"], y=[0.0] * 4, marker_color=["#2563eb", "#6b7280", "#7e57c2", "#10b981"], showlegend=False))
+            fig_var.update_layout(template="plotly_white", height=320, margin=dict(l=10, r=10, t=30, b=10))
+            figs = st.session_state["sales_figs"] = (fig_vf, fig_var)
+        fig_vf, fig_var = figs
+        # Figuras persistidas: a cada cálculo só os y/título do eixo mudam
+        fig_vf.update_traces(selector=dict(name="Variable"), y=[(color_u + white_u + fof_u + fabric_u) * fxv])
+        fig_vf.update_traces(selector=dict(name="Fixed"), y=[fixed_u * fxv])
+        fig_vf.update_layout(yaxis_title=y_title)
+        fig_var.update_traces(selector=dict(name="Breakdown"), y=[color_u * fxv, white_u * fxv, fof_u * fxv, fabric_u * fxv])
+        fig_var.update_layout(yaxis_title=y_title)
+
+        cc1, cc2 = st.columns(2)
+        with cc1:
+            st.subheader("Variable × Fixed (per unit)")
+            st.plotly_chart(fig_vf, use_container_width=True, key="sales_vf_chart", config=plotly_cfg())
+        with cc2:
+            st.subheader("Variable breakdown (per unit)")
+            st.plotly_chart(fig_var, use_container_width=True, key="sales_var_chart", config=plotly_cfg())
+
 def ui_sales_quick_quote():
     UNIT = get_unit()
     unit_lbl = unit_label_short(UNIT)
@@ -1457,21 +1701,21 @@ def ui_sales_quick_quote():
         section("Costs & currency", "Applies to this quote.")
         with st_div("ink-fixed-grid"):
             cc1, cc2, cc3, cc4 = st.columns(4)
-            ink_c = cc1.number_input("Color ink ($/L)", min_value=0.0, value=float(st.session_state.get("sales_ink_c", DEFAULTS["ink_color_per_l"])), step=1.0, key="sales_ink_c")
-            ink_w = cc2.number_input("White ink ($/L)", min_value=0.0, value=float(st.session_state.get("sales_ink_w", DEFAULTS["ink_white_per_l"])), step=1.0, key="sales_ink_w")
-            ink_f = cc3.number_input("FOF / Pretreat ($/L)", min_value=0.0, value=float(st.session_state.get("sales_fof", DEFAULTS["fof_per_l"])), step=1.0, key="sales_fof")
-            fabric = cc4.number_input(f"Substrate ({per_unit(UNIT)})", min_value=0.0, value=float(st.session_state.get("sales_fabric", DEFAULTS["fabric_per_unit"])), step=0.10, key="sales_fabric")
+            ink_c = cc1.number_input("Color ink ($/L)", min_value=0.0, value=float(st.session_state.get("sales_ink_c", DEFAULTS.ink_color_per_l)), step=1.0, key="sales_ink_c")
+            ink_w = cc2.number_input("White ink ($/L)", min_value=0.0, value=float(st.session_state.get("sales_ink_w", DEFAULTS.ink_white_per_l)), step=1.0, key="sales_ink_w")
+            ink_f = cc3.number_input("FOF / Pretreat ($/L)", min_value=0.0, value=float(st.session_state.get("sales_fof", DEFAULTS.fof_per_l)), step=1.0, key="sales_fof")
+            fabric = cc4.number_input(f"Substrate ({per_unit(UNIT)})", min_value=0.0, value=float(st.session_state.get("sales_fabric", DEFAULTS.fabric_per_unit)), step=0.10, key="sales_fabric")
 
         cur1, cur2, cur3 = st.columns(3)
-        SYM = cur1.text_input("Local currency symbol", value=st.session_state.get("sales_local_sym", DEFAULTS["local_symbol"]))
-        FX = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("sales_fx", DEFAULTS["usd_to_local"])), step=0.01)
+        SYM = cur1.text_input("Local currency symbol", value=st.session_state.get("sales_local_sym", DEFAULTS.local_symbol))
+        FX = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("sales_fx", DEFAULTS.usd_to_local)), step=0.01)
         OUTC = cur3.radio("Output currency", ["USD", "Local"], index=1, horizontal=True, key="sales_curr_out")
 
-        st.markdown("---")
+        st.markdown(_SEP_HTML, unsafe_allow_html=True)
         section("Pricing", "Direct per unit or monthly helper.")
         total_fix_m = 0.0
-        prod_m = float(st.session_state.get("sales_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30800.0)))
-        dp = float(st.session_state.get("sales_fix_depr_m", 0.0))
+        prod_m = float(st.session_state.get("sales_fix_prod_month_units", DEFAULTS.prod_month_units))
+        dp = 0.0
         fix_mode = st.radio("Fixed costs mode", ["Direct per unit", "Monthly helper"], index=0, horizontal=True, key="sales_fix_mode")
         if fix_mode.startswith("Direct"):
             with st_div("ink-fixed-grid"):
@@ -1486,16 +1730,20 @@ def ui_sales_quick_quote():
             st.caption(f"Fixed allocation in use: {fixed_per_unit_used:.2f} {per_unit(UNIT)}")
         else:
             st.caption("Monthly fixed costs — labor, leasing, depreciation, overheads and other items.")
-            with st_div("ink-fixed-grid"):
-                fx1, fx2, fx3, fx4 = st.columns(4)
-                fl = fx1.number_input("Labor (monthly)", min_value=0.0, value=0.0, step=10.0, key="sales_fix_labor_m")
-                le = fx2.number_input("Leasing/Rent (monthly)", min_value=0.0, value=0.0, step=10.0, key="sales_fix_leasing_m")
-                dp = fx3.number_input("Depreciation (monthly)", min_value=0.0, value=0.0, step=10.0, key="sales_fix_depr_m")
-                oh = fx4.number_input("Overheads (monthly)", min_value=0.0, value=0.0, step=10.0, key="sales_fix_over_m")
+            # Um único editor de 1 linha no lugar de quatro number_inputs
+            df_month = st.data_editor(
+                pd.DataFrame([dict.fromkeys(_SALES_FIX_MONTH_COLS, 0.0)]),
+                num_rows="fixed",
+                hide_index=True,
+                use_container_width=True,
+                column_config={c: st.column_config.NumberColumn(c, min_value=0.0, step=10.0, format="%.2f") for c in _SALES_FIX_MONTH_COLS},
+                key="sales_fix_month_editor",
+            )
+            fl, le, dp, oh = (float(v) for v in pd.to_numeric(df_month.iloc[0], errors="coerce").fillna(0.0).clip(lower=0.0))
             st.caption("Other fixed (monthly)")
             _fix_input = ensure_df(st.session_state.get("sales_fix_others", [{"Name": "—", "Value": 0.0}]), ["Name", "Value"])
             df_fix = st.data_editor(_fix_input, num_rows="dynamic", use_container_width=True, key="sales_fix_others_editor")
-            sum_others = ensure_df(df_fix, ["Name", "Value"]).get("Value", pd.Series(dtype=float)).fillna(0).sum()
+            sum_others = _sum_value_column(df_fix)
             prod_m = monthly_production_inputs(UNIT, unit_lbl, state_prefix="sales_fix")
             total_fix_m = fl + le + dp + oh + sum_others
             fixed_per_unit_used = (total_fix_m / prod_m) if prod_m > 0 else 0.0
@@ -1507,40 +1755,59 @@ def ui_sales_quick_quote():
                 rnd = float(st.selectbox("Round to", ["0.01", "0.05", "0.10"], index=1, key="sales_round"))
             st.caption(f"Monthly fixed total: {total_fix_m:,.2f}; production: {prod_m:,.0f} {unit_lbl}/month ⇒ allocation: {fixed_per_unit_used:.4f} {per_unit(UNIT)}")
 
+    # Assinatura dos inputs: se nada mudou desde o último cálculo, o snapshot é reaproveitado
+    input_sig = (
+        UNIT, unit_lbl,
+        float(st.session_state.get("sales_width_m", default_width)),
+        float(st.session_state.get("sales_length_m", 1.0)),
+        float(st.session_state.get("sales_waste", 0.0)),
+        tuple(sorted(ml_map_m2.items())), tuple(sorted(display_ml_map.items())),
+        ink_c, ink_w, ink_f, fabric, fixed_per_unit_used,
+        price_in, margin, taxes, terms, rnd, SYM, FX, OUTC,
+        fix_mode, total_fix_m, prod_m, dp,
+        float(st.session_state.get("sales_fix_prod_month_units", DEFAULTS.prod_month_units)),
+    )
+    if do_compute and st.session_state.get("sales_input_sig") == input_sig and "sales_last_res" in st.session_state:
+        do_compute = False
+
     if do_compute:
-        res = simulate(
-            UNIT,
-            float(st.session_state.get("sales_width_m", default_width)),
-            float(st.session_state.get("sales_length_m", 1.0)),
-            float(st.session_state.get("sales_waste", 0.0)),
-            PRINT_MODES["Standard Quality"]["speed"],
-            ml_map_m2,
-            ink_c,
-            ink_w,
-            ink_f,
-            fabric,
-            0.0,
-            0.0,
-            fixed_per_unit_used,
-            show_time_metrics=False,
-        )
+        # Só os inputs físicos/custos entram aqui; margem/impostos/arredondamento são o overlay O(1) abaixo
+        width_s = float(st.session_state.get("sales_width_m", default_width))
+        length_s = float(st.session_state.get("sales_length_m", 1.0))
+        waste_s = float(st.session_state.get("sales_waste", 0.0))
+        speed_s = PRINT_MODES["Standard Quality"]["speed"]
+        sim_args = (UNIT, width_s, length_s, waste_s, speed_s, frozenset(ml_map_m2.items()),
+                    ink_c, ink_w, ink_f, fabric, fixed_per_unit_used)
+        sim_hit = st.session_state.get("sales_sim")
+        if sim_hit is not None and sim_hit[0] == sim_args:
+            res = sim_hit[1]
+        else:
+            res = simulate(
+                UNIT,
+                width_s,
+                length_s,
+                waste_s,
+                speed_s,
+                ml_map_m2,
+                ink_c,
+                ink_w,
+                ink_f,
+                fabric,
+                0.0,
+                0.0,
+                fixed_per_unit_used,
+                show_time_metrics=False,
+            )
+            st.session_state["sales_sim"] = (sim_args, res)
 
         qty = max(1e-9, float(res.get("qty_units", 0.0)))
         total_cost = float(res.get("total_cost", 0.0))
         total_per_unit = total_cost / qty
-        suggested = price_round(total_per_unit * (1 + margin / 100 + taxes / 100), rnd)
-        suggested = price_round(suggested * (1 + terms / 100), rnd)
+        suggested = _suggest_price(total_per_unit, float(margin), float(taxes), float(terms), float(rnd))
         effective_price = price_in if price_in > 0 else suggested
-        rows_tot, rows_unit = build_cost_rows_from_sim(res, unit_lbl, SYM if OUTC == "Local" else "US$", FX if OUTC == "Local" else 1.0, price=effective_price)
-
-        st.markdown("---")
-        st.subheader("Quote result")
-        left, right = st.columns(2)
-        with left:
-            render_info_table("Total ($)", rows_tot)
-        with right:
-            render_info_table(f"Per unit (/{unit_lbl})", rows_unit)
-        render_help_glossary()
+        sym_out = SYM if OUTC == "Local" else "US$"
+        fx_out = FX if OUTC == "Local" else 1.0
+        rows_tot, rows_unit = build_cost_rows_from_sim(res, unit_lbl, sym_out, fx_out, price=effective_price)
 
         ink_total = float(res.get("cost_ink", 0.0))
         fabric_cost = fabric_total(res)
@@ -1548,123 +1815,83 @@ def ui_sales_quick_quote():
         variable_total = ink_total + fabric_cost + other_var
         variable_per_unit = variable_total / qty
         fixed_month_total = float(total_fix_m) if fix_mode.startswith("Monthly") else 0.0
-        fig_be = breakeven_figure(
-            price_u=effective_price,
-            variable_u=variable_per_unit,
-            fixed_month=fixed_month_total,
-            unit_lbl=unit_lbl,
-            sym=(SYM if OUTC == "Local" else "US$"),
-            fx=(FX if OUTC == "Local" else 1.0),
-            title="Break-even — Quick quote",
-        )
-        st.plotly_chart(fig_be, use_container_width=True, key="sales_be_chart", config=plotly_cfg())
-        try:
-            sym_out = SYM if OUTC == "Local" else "US$"
-            fx_out = FX if OUTC == "Local" else 1.0
-            render_break_even_insights(effective_price, variable_per_unit, fixed_month_total, unit_lbl, sym_out, fx_out, label="Quote")
-        except Exception:
-            pass
 
-        pay_sym = SYM if OUTC == "Local" else "US$"
-        pay_fx = FX if OUTC == "Local" else 1.0
         if fix_mode.startswith("Monthly"):
             monthly_units_pay = float(prod_m or 0.0)
             fixed_month_pay = float(total_fix_m or 0.0)
             depreciation_pay = float(dp or 0.0)
         else:
-            monthly_units_pay = float(st.session_state.get("sales_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30800.0)))
+            monthly_units_pay = float(st.session_state.get("sales_fix_prod_month_units", DEFAULTS.prod_month_units))
             if monthly_units_pay <= 0:
-                monthly_units_pay = DEFAULTS.get("prod_month_units", 30800.0)
+                monthly_units_pay = DEFAULTS.prod_month_units
             fixed_month_pay = float(fixed_per_unit_used or 0.0) * monthly_units_pay
             depreciation_pay = 0.0
 
-        render_payback_block(
-            "sales",
-            "Sales workflow",
-            price_per_unit=float(effective_price),
-            variable_per_unit=float(variable_per_unit),
-            fixed_per_unit=float(fixed_per_unit_used or 0.0),
-            default_monthly_units=monthly_units_pay,
-            default_fixed_month=fixed_month_pay,
-            default_depreciation_month=depreciation_pay,
-            sym=pay_sym,
-            fx=pay_fx,
-            unit_lbl=unit_lbl,
-        )
-
-        st.markdown("---")
-        show_charts = st.checkbox("Show cost charts", value=True, key="sales_show_cost_charts")
-        if show_charts:
-            fxv = FX if OUTC == "Local" else 1.0
-            color_ml_u = float(display_ml_map.get("Color", 0.0))
-            white_ml_u = float(display_ml_map.get("White", 0.0))
-            fof_ml_u = float(display_ml_map.get("FOF", 0.0))
-            color_u = (color_ml_u / 1000.0) * float(ink_c or 0.0)
-            white_u = (white_ml_u / 1000.0) * float(ink_w or 0.0)
-            fof_u = (fof_ml_u / 1000.0) * float(ink_f or 0.0)
-            fabric_u = float(fabric or 0.0)
-            fixed_u = float(fixed_per_unit_used or 0.0)
-
-            fig_vf = go.Figure()
-            fig_vf.add_trace(go.Bar(name="Variable", x=["Per unit"], y=[(color_u + white_u + fof_u + fabric_u) * fxv], marker_color="#3b82f6"))
-            fig_vf.add_trace(go.Bar(name="Fixed", x=["Per unit"], y=[fixed_u * fxv], marker_color="#9ca3af"))
-            fig_vf.update_layout(barmode="stack", template="plotly_white", height=320, margin=dict(l=10, r=10, t=30, b=10), yaxis_title=f"{SYM if OUTC == 'Local' else 'US$'} / {unit_lbl}")
+        # Snapshot do último cálculo: o fragmento de resultados relê daqui, então
+        # checkbox/gráficos/payback não refazem simulate nem somem no próximo rerun.
+        st.session_state["sales_last_res"] = {
+            "unit_lbl": unit_lbl,
+            "rows_tot": rows_tot,
+            "rows_unit": rows_unit,
+            "price": float(effective_price),
+            "variable_u": float(variable_per_unit),
+            "fixed_u": float(fixed_per_unit_used or 0.0),
+            "fixed_month": fixed_month_total,
+            "sym": sym_out,
+            "fx": fx_out,
+            "monthly_units_pay": monthly_units_pay,
+            "fixed_month_pay": fixed_month_pay,
+            "depreciation_pay": depreciation_pay,
+            "color_u": (float(display_ml_map.get("Color", 0.0)) / 1000.0) * float(ink_c or 0.0),
+            "white_u": (float(display_ml_map.get("White", 0.0)) / 1000.0) * float(ink_w or 0.0),
+            "fof_u": (float(display_ml_map.get("FOF", 0.0)) / 1000.0) * float(ink_f or 0.0),
+            "fabric_u": float(fabric or 0.0),
+        }
+        st.session_state["sales_input_sig"] = input_sig
 
-            fig_var = go.Figure()
-            fig_var.add_trace(go.Bar(x=["Color ink", "White ink", "FOF / Pretreat", "Fabric"], y=[color_u * fxv, white_u * fxv, fof_u * fxv, fabric_u * fxv], marker_color=["#2563eb", "#6b7280", "#7e57c2", "#10b981"]))
-            fig_var.update_layout(template="plotly_white", height=320, margin=dict(l=10, r=10, t=30, b=10), yaxis_title=f"{SYM if OUTC == 'Local' else 'US$'} / {unit_lbl}")
-
-            cc1, cc2 = st.columns(2)
-            with cc1:
-                st.subheader("Variable × Fixed (per unit)")
-                st.plotly_chart(fig_vf, use_container_width=True, key="sales_vf_chart", config=plotly_cfg())
-            with cc2:
-                st.subheader("Variable breakdown (per unit)")
-                st.plotly_chart(fig_var, use_container_width=True, key="sales_var_chart", config=plotly_cfg())
+    if "sales_last_res" in st.session_state:
+        _sales_results_fragment()
     else:
         st.info("Adjust the quote inputs and click Apply to calculate.")
 
 # === Fire Pixels (helpers) =========================================
-def fire_pixels_map_from_xml_bytes(xml_bytes: bytes) -> dict:
+def fire_pixels_map_from_xml_bytes(xml_bytes: bytes, xml_hash: bytes | None = None) -> dict:
     """Retorna {Channel: pixels} com nomes normalizados."""
-    _, _, fire_pixels, _ = parse_xml(xml_bytes)
-    out = {}
-    for sep, px in (fire_pixels or {}).items():
-        out[normalize_sep_name(sep)] = float(px or 0.0)
-    return out
+    return _cached_fire_px(xml_hash or _xml_hash(xml_bytes), xml_bytes)
+
+def _xml_union_maps(zbytes: bytes, cache_ns: str | None = None) -> Tuple[dict, dict]:
+    """Sum ml/m² and fire pixels across all XMLs in the ZIP, parsing each XML once.
+    Memoized per ZIP digest in session_state so widget reruns skip the ZIP walk."""
+    digest = _zip_digest(zbytes)
+    ss = st.session_state
+    ml_key, fp_key = f"{digest}:ml_union", f"{digest}:fp_union"
+    if ml_key in ss and fp_key in ss:
+        return ss[ml_key], ss[fp_key]
+    ml_out, fp_out = {}, {}
+    _, xmls, *_ = read_zip_listing(zbytes, cache_ns=cache_ns)
+    for _xp, xml_bytes in _iter_zip_entries(zbytes, xmls, digest):
+        *_, mm, mp = parse_xml(xml_bytes)
+        for k, v in mm.items():
+            if k:
+                ml_out[k] = ml_out.get(k, 0.0) + float(v or 0.0)
+        for k, v in mp.items():
+            if k:
+                fp_out[k] = fp_out.get(k, 0.0) + float(v or 0.0)
+    ss[ml_key], ss[fp_key] = ml_out, fp_out
+    return ml_out, fp_out
 
 def fire_pixels_union_all_xmls(zbytes: bytes, cache_ns: str | None = None) -> dict:
     """Sum fire pixels across all XMLs in the ZIP (useful if the selected XML only has FOF/White)."""
-    out = {}
-    _, xmls, *_ = read_zip_listing(zbytes, cache_ns=cache_ns)
-    for xp in xmls:
-        mp = fire_pixels_map_from_xml_bytes(read_bytes_from_zip(zbytes, xp, cache_ns=cache_ns))
-        for k, v in (mp or {}).items():
-            if not k:
-                continue
-            out[k] = out.get(k, 0.0) + float(v or 0.0)
-    return out
+    return dict(_xml_union_maps(zbytes, cache_ns)[1])
 
 # =========================
 # ZIP / imagem helpers
 # =========================
 def has_color_channels(ml_map: dict) -> bool:
-    for k in (ml_map or {}):
-        low = (k or "").strip().lower()
-        if low not in CHANNELS_WHITE and low not in CHANNELS_FOF:
-            return True
-    return False
+    return any(channel_class(k) == 0 for k in (ml_map or {}))
 
 def ml_map_union_all_xmls(zbytes: bytes, cache_ns: str | None = None) -> dict:
-    out = {}
-    files, xmls, *_ = read_zip_listing(zbytes, cache_ns=cache_ns)
-    for xp in xmls:
-        mm = ml_per_m2_from_xml_bytes(read_bytes_from_zip(zbytes, xp, cache_ns=cache_ns))
-        for k, v in (mm or {}).items():
-            if not k:
-                continue
-            out[k] = out.get(k, 0.0) + float(v or 0.0)
-    return out
+    return dict(_xml_union_maps(zbytes, cache_ns)[0])
 def pick_first_with_colors(zbytes: bytes, cache_ns: str | None = None) -> dict:
     """Return ml/m² map from the first XML in the ZIP that contains any color channel (not just White/FOF)."""
     _, xmls, *_ = read_zip_listing(zbytes, cache_ns=cache_ns)
@@ -1687,49 +1914,132 @@ def strip_appledouble(path: str) -> str:
         return path.rsplit("/",1)[0] + "/" + base[2:] if "/" in path else base[2:]
     return path
 
+# Digest por objeto neste run: (id, len) → (bytes, sha1). Guardar o próprio objeto evita
+# reaproveitar um id liberado pelo GC; o dict é recriado a cada rerun do script.
+_DIGEST_CACHE: Dict[Tuple[int, int], Tuple[bytes, str]] = {}
+
 def _zip_digest(zbytes: bytes) -> str:
-    return hashlib.sha1(zbytes).hexdigest()
+    key = (id(zbytes), len(zbytes))
+    hit = _DIGEST_CACHE.get(key)
+    if hit is not None and hit[0] is zbytes:
+        return hit[1]
+    digest = hashlib.sha1(zbytes).hexdigest()
+    _DIGEST_CACHE[key] = (zbytes, digest)
+    return digest
+
+@st.cache_resource(max_entries=8, ttl=3600, show_spinner=False)
+def _open_zip(zip_digest: str, _zbytes: bytes) -> zipfile.ZipFile:
+    # Um ZipFile aberto por ZIP: o diretório central é lido uma vez e reaproveitado entre reruns.
+    # Só leitura (read/open); nunca fechar — o objeto é compartilhado pelo cache_resource.
+    return zipfile.ZipFile(io.BytesIO(_zbytes))
 
 @st.cache_data(max_entries=128, ttl=3600, show_spinner=False)
-def _cached_zip_listing(zip_key: str, zbytes: bytes):
-    with zipfile.ZipFile(io.BytesIO(zbytes)) as z:
-        files = [n for n in z.namelist() if not n.endswith("/")]
-    xmls = [n for n in files if n.lower().endswith(".xml")]
-    jpgs = [n for n in files if n.lower().endswith((".jpg",".jpeg")) and not n.split("/")[-1].startswith("._")]
-    tifs = [n for n in files if n.lower().endswith((".tif",".tiff")) and not n.split("/")[-1].startswith("._")]
-    ad = any(n.split("/")[-1].startswith("._") for n in files)
+def _cached_zip_listing(cache_ns: str, zip_digest: str, _zbytes: bytes):
+    # _zbytes não entra no hash do cache: o digest já identifica o ZIP
+    names = _open_zip(zip_digest, _zbytes).namelist()
+    # Uma passada só: classifica cada entrada por sufixo/basename
+    files, xmls, jpgs, tifs = [], [], [], []
+    ad = False
+    for n in names:
+        if n.endswith("/"):
+            continue
+        files.append(n)
+        low = n.lower()
+        is_ad = n.rpartition("/")[2].startswith("._")
+        ad = ad or is_ad
+        if low.endswith(".xml"):
+            xmls.append(n)
+        elif is_ad:
+            continue
+        elif low.endswith((".jpg", ".jpeg")):
+            jpgs.append(n)
+        elif low.endswith((".tif", ".tiff")):
+            tifs.append(n)
     return files, xmls, jpgs, tifs, ad
 
-def read_zip_listing(zfile_bytes: bytes, cache_ns: str | None = None):
-    key = f"{cache_ns or 'zip'}_{_zip_digest(zfile_bytes)}"
-    return _cached_zip_listing(key, zfile_bytes)
+def read_zip_listing(zfile_bytes: bytes, cache_ns: str | None = None, zip_key: str | None = None):
+    return _cached_zip_listing(cache_ns or "zip", zip_key or _zip_digest(zfile_bytes), zfile_bytes)
 
 @st.cache_data(max_entries=512, ttl=3600, show_spinner=False)
-def _cached_zip_entry(zip_key: str, inner_path: str, zbytes: bytes) -> bytes:
-    with zipfile.ZipFile(io.BytesIO(zbytes)) as z:
-        return z.read(inner_path)
+def _cached_zip_entry(cache_ns: str, zip_digest: str, inner_path: str, _zbytes: bytes) -> bytes:
+    return _open_zip(zip_digest, _zbytes).read(inner_path)
 
-def read_bytes_from_zip(zfile_bytes: bytes, inner_path: str, cache_ns: str | None = None) -> bytes:
-    key = f"{cache_ns or 'zip'}_{_zip_digest(zfile_bytes)}"
-    return _cached_zip_entry(key, inner_path, zfile_bytes)
+def read_bytes_from_zip(zfile_bytes: bytes, inner_path: str, cache_ns: str | None = None, zip_key: str | None = None) -> bytes:
+    return _cached_zip_entry(cache_ns or "zip", zip_key or _zip_digest(zfile_bytes), inner_path, zfile_bytes)
 
-def _get_preview_raw(zfile_bytes: bytes, inner_path: str, cache_ns: str | None = None) -> bytes:
-    raw = read_bytes_from_zip(zfile_bytes, inner_path, cache_ns)
+_PREVIEW_RE = re.compile(r"preview", re.I)
+
+def _zip_index(zbytes: bytes, cache_ns: str | None = None, zip_key: str | None = None) -> dict:
+    """Listing + channel -> TIFF map + has-preview flag for one ZIP.
+    Memoized per ZIP digest in session_state so widget reruns skip the path scan."""
+    digest = zip_key or _zip_digest(zbytes)
+    ss = st.session_state
+    key = f"{digest}:zidx"
+    if key in ss:
+        return ss[key]
+    files, xmls, jpgs, tifs, _ = read_zip_listing(zbytes, cache_ns=cache_ns, zip_key=digest)
+    chan_map = {}
+    for p in tifs:
+        ch = get_channel_from_filename(p.split("/")[-1])
+        if ch:
+            chan_map[ch] = p
+    idx = {
+        "files": files, "xmls": xmls, "jpgs": jpgs, "tifs": tifs,
+        "chan_map": chan_map,
+        "has_preview": any(_PREVIEW_RE.search(p) for p in jpgs),
+    }
+    ss[key] = idx
+    return idx
+
+def _iter_zip_entries(zbytes: bytes, paths: List[str], zip_digest: str | None = None) -> Iterator[Tuple[str, bytes]]:
+    # Leitura em lote direto do ZipFile compartilhado (read_bytes_from_zip fica para o preview avulso)
+    z = _open_zip(zip_digest or _zip_digest(zbytes), zbytes)
+    for p in paths:
+        yield p, z.read(p)
+
+def _get_preview_raw(zfile_bytes: bytes, inner_path: str, cache_ns: str | None = None, zip_key: str | None = None) -> bytes:
+    raw = read_bytes_from_zip(zfile_bytes, inner_path, cache_ns, zip_key)
     if not is_probably_tiff(raw):
         alt = strip_appledouble(inner_path)
         if alt != inner_path:
             try:
-                raw_alt = read_bytes_from_zip(zfile_bytes, alt, cache_ns)
+                raw_alt = read_bytes_from_zip(zfile_bytes, alt, cache_ns, zip_key)
                 if is_probably_tiff(raw_alt):
                     raw = raw_alt
             except KeyError:
                 pass
     return raw
 
+@contextmanager
+def _open_preview_stream(zbytes: bytes, inner_path: str, zip_digest: str | None = None):
+    """Open the preview entry as a stream (not cached); same AppleDouble fallback as _get_preview_raw,
+    but only the first 8 bytes are read to sniff the TIFF signature."""
+    z = _open_zip(zip_digest or _zip_digest(zbytes), zbytes)
+    member = inner_path
+    with z.open(inner_path) as f:
+        is_tiff = is_probably_tiff(f.read(8))
+    if not is_tiff:
+        alt = strip_appledouble(inner_path)
+        if alt != inner_path:
+            try:
+                with z.open(alt) as f:
+                    if is_probably_tiff(f.read(8)):
+                        member = alt
+            except KeyError:
+                pass
+    with z.open(member) as f:
+        yield f
+
 @st.cache_data(max_entries=256, ttl=3600, show_spinner=False)
-def make_preview_thumb(raw_img: bytes, target_w: int, target_h: int, *, fill: bool, trim: bool, max_side: int) -> bytes:
-    """Return a JPEG thumbnail (bytes) ready for st.image rendering."""
-    im = Image.open(io.BytesIO(raw_img))
+def make_preview_thumb_cached(zip_digest: str, inner_path: str, target_w: int, target_h: int, fill: bool, trim: bool, max_side: int, _zbytes: bytes) -> bytes:
+    """Thumbnail cached on (digest, path, params): the key is a few scalars, never the image bytes."""
+    # Decodifica direto do stream do ZIP: o TIFF inteiro não é copiado para bytes nem cacheado
+    with _open_preview_stream(_zbytes, inner_path, zip_digest) as f:
+        return _make_preview_thumb_inner(f, target_w, target_h, fill=fill, trim=trim, max_side=max_side)
+
+def _make_preview_thumb_inner(raw_img, target_w: int, target_h: int, *, fill: bool, trim: bool, max_side: int) -> bytes:
+    """Return a JPEG thumbnail (bytes) ready for st.image rendering. raw_img: bytes or a binary file object."""
+    im = Image.open(io.BytesIO(raw_img) if isinstance(raw_img, (bytes, bytearray)) else raw_img)
     if getattr(im, "n_frames", 1) > 1:
         try:
             im.seek(0)
@@ -1760,20 +2070,21 @@ def make_preview_thumb(raw_img: bytes, target_w: int, target_h: int, *, fill: bo
     return buf.getvalue()
 
 @fragment_decorator if fragment_decorator else (lambda fn: fn)
-def preview_fragment(fragment_key: str, zip_bytes: bytes | None, inner_path: str | None, *, width: int, height: int, fill_flag: bool, trim_flag: bool, max_side: int, caption: str):
+def preview_fragment(fragment_key: str, zip_bytes: bytes | None, inner_path: str | None, *, width: int, height: int, fill_flag: bool, trim_flag: bool, max_side: int, caption: str, zip_key: str | None = None):
     if not zip_bytes or not inner_path:
         st.info("Preview unavailable for this selection.")
         return
     try:
         with st.spinner("Carregando preview…"):
-            raw = _get_preview_raw(zip_bytes, inner_path, cache_ns=fragment_key)
-            thumb_bytes = make_preview_thumb(
-                raw,
+            thumb_bytes = make_preview_thumb_cached(
+                zip_key or _zip_digest(zip_bytes),
+                inner_path,
                 width,
                 height,
-                fill=fill_flag,
-                trim=trim_flag,
-                max_side=max_side,
+                bool(fill_flag),
+                bool(trim_flag),
+                max_side,
+                zip_bytes,
             )
         st.image(thumb_bytes, caption=caption, width=width)
     except Exception as exc:
@@ -1782,11 +2093,13 @@ def preview_fragment(fragment_key: str, zip_bytes: bytes | None, inner_path: str
 def letterbox(im: PILImageType, target_w: int, target_h: int, bg=(245,247,251)) -> PILImageType:
     if im.mode not in ("RGB","RGBA","L"):
         im = im.convert("RGB")
-    im_copy = im.copy()
-    im_copy.thumbnail((target_w, target_h), Image.LANCZOS)
+    # Sem copy(): resize já devolve uma imagem nova; como o thumbnail(), nunca amplia
+    r = min(target_w/max(1, im.width), target_h/max(1, im.height), 1.0)
+    if r < 1.0:
+        im = im.resize((max(1, int(im.width*r)), max(1, int(im.height*r))), Image.LANCZOS, reducing_gap=2.0)
     canvas = Image.new("RGB", (target_w, target_h), bg)
-    x = (target_w - im_copy.width)//2; y = (target_h - im_copy.height)//2
-    canvas.paste(im_copy, (x,y))
+    x = (target_w - im.width)//2; y = (target_h - im.height)//2
+    canvas.paste(im, (x,y))
     return canvas
 
 def load_preview_light(zfile_bytes: bytes, inner_path: str, max_side: int = 640, cache_ns: str | None = None) -> PILImageType:
@@ -1846,7 +2159,7 @@ def plotly_cfg():
 def _reset_heavy_session_state():
     try:
         keys = list(st.session_state.keys())
-        patterns = ["_zip_bytes", "_panels", "_legend", "batch_"]
+        patterns = ["_zip_bytes", "_zip_key", "_zip_file_id", ":ml_union", ":fp_union", ":zidx", "_pdf_bytes", "_pdf_sig", "_last_res", "_panels", "_legend", "batch_"]
         for k in keys:
             if any(p in k for p in patterns):
                 try:
@@ -1872,74 +2185,102 @@ def render_tools_sidebar():
     except Exception:
         pass
 
+@lru_cache(maxsize=8)
+def _trim_lut(threshold: int) -> Tuple[int, ...]:
+    # 255 onde há conteúdo (mais escuro que o threshold), 0 no fundo claro
+    return tuple(255 if p < threshold else 0 for p in range(256))
+
 def trim_margins(im: PILImageType, threshold: int = 245, margin_px: int = 2) -> PILImageType:
     """Auto-trim near-white borders. threshold 0-255: larger → more aggressive.
     Only removes uniform light margins; returns original if no content bbox is found."""
     try:
-        arr = np.asarray(im.convert("L"))
-        mask = arr < threshold  # True where there is content (darker than threshold)
-        if not mask.any():
+        # Imagens grandes: varre a máscara em 1/16 dos pixels (reduce 4×4) e reescala a bbox.
+        # Converte para "L" antes: reduce não aceita modos como I;16 (TIFFs de separação 16 bits)
+        scale = 4 if im.width * im.height >= 256 * 256 else 1
+        small = im.convert("L")
+        small = small.reduce(scale) if scale > 1 else small
+        # Threshold fixo sobre o cinza original (sem esticar contraste): conteúdo claro não vira margem.
+        # LUT + getbbox rodam no libImaging.
+        bbox = small.point(_trim_lut(int(threshold))).getbbox()
+        if bbox is None:
             return im
-        rows = np.where(mask.any(axis=1))[0]
-        cols = np.where(mask.any(axis=0))[0]
-        r0, r1 = int(max(0, rows.min() - margin_px)), int(min(arr.shape[0], rows.max() + 1 + margin_px))
-        c0, c1 = int(max(0, cols.min() - margin_px)), int(min(arr.shape[1], cols.max() + 1 + margin_px))
+        c0, r0, c1, r1 = bbox
+        r0, r1 = max(0, r0 * scale - margin_px), min(im.height, r1 * scale + margin_px)
+        c0, c1 = max(0, c0 * scale - margin_px), min(im.width, c1 * scale + margin_px)
         if r1 <= r0 or c1 <= c0:
             return im
         return im.crop((c0, r0, c1, r1))
     except Exception:
         return im
 
+_RE_EXT = re.compile(r"\.[^.]+$")
+_RE_NONALNUM = re.compile(r"[^a-z0-9]+")
+_RE_SUF = re.compile(r"[_\-]([cmykrgwf])$")
+_SUF_TO_CHANNEL = {"c":"Cyan","m":"Magenta","y":"Yellow","k":"Black",
+                   "r":"Red","g":"Green","w":"White","f":"FOF"}
+# Token → (prioridade, canal); a prioridade preserva a ordem da antiga escada de ifs
+_TOKEN_TO_CHANNEL: Dict[str, Tuple[int, str]] = {}
+for _prio, (_ch, _toks) in enumerate((
+    ("Cyan",    ("c","cyan","ciano")),
+    ("Magenta", ("m","magenta")),
+    ("Yellow",  ("y","yellow","amarelo","amarela")),
+    ("Black",   ("k","black","preto")),
+    ("Red",     ("r","red","vermelho","vermelha")),
+    ("Green",   ("g","green","verde")),
+    # White
+    ("White",   ("w","white","branco","whiteink","white_ink","brancoink","branco_ink")),
+    # FOF / pré-trat.
+    ("FOF",     ("fof","fix","fixation","pretreat","pre_treat","pretreatment",
+                 "duosoft","softener","fixacao","pretratamento","pretratar","fixacaofof")),
+)):
+    for _t in _toks:
+        _TOKEN_TO_CHANNEL.setdefault(_t, (_prio, _ch))
+del _prio, _ch, _toks, _t
+_CHANNEL_LETTERS = frozenset("cmykrgw")
+# Fallback por substring (ordem importa)
+_SUBSTR_TABLE = (
+    ("cyan", "Cyan"), ("ciano", "Cyan"),
+    ("magenta", "Magenta"),
+    ("yellow", "Yellow"), ("amarel", "Yellow"),
+    ("black", "Black"), ("preto", "Black"),
+    ("red", "Red"), ("vermelh", "Red"),
+    ("green", "Green"), ("verde", "Green"),
+    ("white", "White"), ("branco", "White"),
+    ("fof", "FOF"), ("fixation", "FOF"), ("pretreat", "FOF"), ("duosoft", "FOF"),
+    ("softener", "FOF"), ("fixacao", "FOF"), ("pretrat", "FOF"),
+)
+
 def get_channel_from_filename(name: str):
-    base_raw   = re.sub(r"\.[^.]+$", "", name or "")
+    base_raw   = _RE_EXT.sub("", name or "")
     base_ascii = _deaccent(base_raw).lower()
-    base_norm  = re.sub(r"[^a-z0-9]+", "_", base_ascii)
+    base_norm  = _RE_NONALNUM.sub("_", base_ascii)
     tokens     = set(filter(None, base_norm.split("_")))
-    glued      = base_norm.replace("_", "")
 
-    # CMYK + extras (tokens)
-    if tokens & {"c","cyan","ciano"}: return "Cyan"
-    if tokens & {"m","magenta"}:      return "Magenta"
-    if tokens & {"y","yellow","amarelo","amarela"}: return "Yellow"
-    if tokens & {"k","black","preto"}: return "Black"
-    if tokens & {"r","red","vermelho","vermelha"}:  return "Red"
-    if tokens & {"g","green","verde"}:              return "Green"
-
-    # White
-    if tokens & {"w","white","branco","whiteink","white_ink","brancoink","branco_ink"}:
-        return "White"
-
-    # FOF / pré-trat.
-    if tokens & {"fof","fix","fixation","pretreat","pre_treat","pretreatment",
-                 "duosoft","softener","fixacao","pretratamento","pretratar","fixacaofof"}:
-        return "FOF"
+    # CMYK + extras, White, FOF (tokens) — menor prioridade vence
+    hit = min((_TOKEN_TO_CHANNEL[t] for t in tokens if t in _TOKEN_TO_CHANNEL), default=None)
+    if hit:
+        return hit[1]
 
     # Sufixo único (_c/_m/_y/_k/_r/_g/_w/_f)
-    suf = re.search(r"[_\-]([cmykrgwf])$", base_norm)
+    suf = _RE_SUF.search(base_norm)
     if suf:
-        return {"c":"Cyan","m":"Magenta","y":"Yellow","k":"Black",
-                "r":"Red","g":"Green","w":"White","f":"FOF"}[suf.group(1)]
+        return _SUF_TO_CHANNEL[suf.group(1)]
 
     # "f" sozinho só vira FOF se não houver outra letra de canal
-    if ("f" in tokens) and not (tokens & {"c","m","y","k","r","g","w"}):
+    if ("f" in tokens) and tokens.isdisjoint(_CHANNEL_LETTERS):
         return "FOF"
     # combinação NS + F (ex.: P7589_NS_F)
     if ("ns" in tokens) and ("f" in tokens):
         return "FOF"
 
     # Fallback por substring
-    if "cyan" in base_ascii or "ciano" in base_ascii:   return "Cyan"
-    if "magenta" in base_ascii:                          return "Magenta"
-    if "yellow" in base_ascii or "amarel" in base_ascii: return "Yellow"
-    if "black" in base_ascii or "preto"  in base_ascii:  return "Black"
-    if "red"   in base_ascii or "vermelh" in base_ascii: return "Red"
-    if "green" in base_ascii or "verde"   in base_ascii: return "Green"
-    if "white" in base_ascii or "branco"  in base_ascii: return "White"
-    if any(w in base_ascii for w in ["fof","fixation","pretreat","duosoft","softener","fixacao","pretrat"]):
-        return "FOF"
+    for needle, ch in _SUBSTR_TABLE:
+        if needle in base_ascii:
+            return ch
 
     return None
 
+@lru_cache(maxsize=256)
 def normalize_sep_name(name: str) -> str:
     n = (name or "").strip().lower().replace(" ", "").replace("_", "")
     # Canais de cor — aceita letra única e nomes
@@ -1959,44 +2300,80 @@ def normalize_sep_name(name: str) -> str:
 # =========================
 # Parsing do XML e conversões
 # =========================
-@st.cache_data(show_spinner=False)
+_XML_SCALARS = frozenset(("Width", "Height", "Printer", "JobName", "Resolution", "PrintSpeed", "OutputProfile"))
+_XML_ML_TAG = "NumberOfMlPerSeparation"
+_XML_PX_TAG = "NumberOfFirePixelsPerSeparation"
+_XML_LIST_TAGS = frozenset((_XML_ML_TAG, "NumberOfMlPerSeperation", _XML_PX_TAG))
+
+# hash_funcs: a chave vira o SHA1 dos bytes em vez do hash padrão do conteúdo inteiro
+@st.cache_data(show_spinner=False, hash_funcs={bytes: lambda b: hashlib.sha1(b).hexdigest()})
 def parse_xml(xml_bytes: bytes):
-    root = ET.fromstring(xml_bytes)
+    # Streaming: só olhamos os filhos diretos da raiz; cada um é limpo após o uso
+    # e o parse para assim que os escalares e as duas listas já foram lidos.
+    # Os filhos já lidos também saem da raiz, então a memória não cresce com o XML.
+    scalars: Dict[str, str] = {}
+    lists: Dict[str, List[Tuple[str, str]]] = {}
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(io.BytesIO(xml_bytes), events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        tag = elem.tag
+        if tag in _XML_SCALARS:
+            if tag not in scalars:
+                scalars[tag] = elem.text or ""
+        elif tag in _XML_LIST_TAGS and tag not in lists:
+            lists[tag] = [(child.tag, child.text or "0") for child in elem]
+        elem.clear()
+        del root[:]
+        if len(scalars) == len(_XML_SCALARS) and _XML_ML_TAG in lists and _XML_PX_TAG in lists:
+            break
+
     def f(x):
         try: return float(x)
         except Exception: return 0.0
-    width  = f(root.findtext("Width","0"))     # cm
-    height = f(root.findtext("Height","0"))    # cm
+    width  = f(scalars.get("Width","0"))     # cm
+    height = f(scalars.get("Height","0"))    # cm
     area_m2 = (width/100.0)*(height/100.0)
 
-    ml_node = root.find("NumberOfMlPerSeparation")
+    ml_node = lists.get(_XML_ML_TAG)
     if ml_node is None:
-        ml_node = root.find("NumberOfMlPerSeperation")
+        ml_node = lists.get("NumberOfMlPerSeperation")
     ml_per_sep = {}
-    if ml_node is not None:
-        for child in ml_node:
-            try: ml_per_sep[child.tag] = float(child.text or "0")
-            except Exception: ml_per_sep[child.tag] = 0.0
+    for tag, text in ml_node or ():
+        try: ml_per_sep[tag] = float(text)
+        except Exception: ml_per_sep[tag] = 0.0
 
-    px_node = root.find("NumberOfFirePixelsPerSeparation")
     fire_pixels = {}
-    if px_node is not None:
-        for child in px_node:
-            try: fire_pixels[child.tag] = int(float(child.text or "0"))
-            except Exception: fire_pixels[child.tag] = 0
+    for tag, text in lists.get(_XML_PX_TAG) or ():
+        try: fire_pixels[tag] = int(float(text))
+        except Exception: fire_pixels[tag] = 0
 
     meta = {
-        "printer": root.findtext("Printer","N/A"),
-        "job_name": root.findtext("JobName","N/A"),
-        "resolution": root.findtext("Resolution","N/A"),
-        "print_speed": root.findtext("PrintSpeed","N/A"),
-        "output_profile": root.findtext("OutputProfile","N/A"),
+        "printer": scalars.get("Printer","N/A"),
+        "job_name": scalars.get("JobName","N/A"),
+        "resolution": scalars.get("Resolution","N/A"),
+        "print_speed": scalars.get("PrintSpeed","N/A"),
+        "output_profile": scalars.get("OutputProfile","N/A"),
         "width_cm": width, "height_cm": height, "area_m2": area_m2
     }
-    return area_m2, ml_per_sep, fire_pixels, meta
+    # Mapas já normalizados (ml/m² e pixels) ficam atrás do mesmo cache_data
+    ml_per_m2 = {normalize_sep_name(sep): ml_total/area_m2 for sep, ml_total in ml_per_sep.items()} if area_m2 > 0 else {}
+    fire_px_norm = {normalize_sep_name(sep): float(px or 0.0) for sep, px in fire_pixels.items()}
+    return area_m2, ml_per_sep, fire_pixels, meta, ml_per_m2, fire_px_norm
+
+def get_xml_dims_m(xml_bytes: bytes, xml_hash: bytes | None = None) -> Tuple[float,float,float]:
+    return _cached_xml_dims(xml_hash or _xml_hash(xml_bytes), xml_bytes)
 
-def get_xml_dims_m(xml_bytes: bytes) -> Tuple[float,float,float]:
-    area_m2, _, _, meta = parse_xml(xml_bytes)
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_xml_dims(xml_hash: bytes, _xml_bytes: bytes) -> Tuple[float,float,float]:
+    area_m2, _, _, meta, *_ = parse_xml(_xml_bytes)
     w_m = (meta.get("width_cm") or 0)/100.0
     h_m = (meta.get("height_cm") or 0)/100.0
     if w_m>0 and h_m>0:
@@ -2006,23 +2383,60 @@ def get_xml_dims_m(xml_bytes: bytes) -> Tuple[float,float,float]:
         return side, side, area_m2
     return 1.0, 1.0, 1.0
 
-def ml_per_m2_from_xml_bytes(xml_bytes: bytes) -> dict:
-    area, ml_sep, _, _ = parse_xml(xml_bytes)
-    out = {}
-    if area > 0:
-        for sep, ml_total in ml_sep.items():
-            out[normalize_sep_name(sep)] = ml_total/area
-    return out
+def _xml_hash(xml_bytes: bytes) -> bytes:
+    # Chave curta (16 bytes) para os helpers de XML; o hasher do Streamlit não vê os bytes do XML
+    return hashlib.blake2b(xml_bytes, digest_size=16).digest()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_ml_per_m2(xml_hash: bytes, _xml_bytes: bytes) -> dict:
+    return parse_xml(_xml_bytes)[4]
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_fire_px(xml_hash: bytes, _xml_bytes: bytes) -> dict:
+    return parse_xml(_xml_bytes)[5]
+
+def parse_xml_meta_only(xml_bytes: bytes) -> dict:
+    """Only Resolution/PrintSpeed (direct children of the root); stops as soon as both are seen."""
+    found: Dict[str, str] = {}
+    depth = 0
+    for event, elem in ET.iterparse(io.BytesIO(xml_bytes), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            if elem.tag in ("Resolution", "PrintSpeed") and elem.tag not in found:
+                found[elem.tag] = elem.text or ""
+                if len(found) == 2:
+                    break
+            elem.clear()
+    return {"resolution": found.get("Resolution", "N/A"), "print_speed": found.get("PrintSpeed", "N/A")}
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_infer_mode(xml_hash: bytes, _xml_bytes: bytes):
+    return _infer_mode_from_meta(parse_xml_meta_only(_xml_bytes))
+
+def ml_per_m2_from_xml_bytes(xml_bytes: bytes, xml_hash: bytes | None = None) -> dict:
+    return _cached_ml_per_m2(xml_hash or _xml_hash(xml_bytes), xml_bytes)
 
 # =========================
 # Utilidades de modo
 # =========================
-def has_white_in_xml(xml_bytes: bytes) -> bool:
-    ml = ml_per_m2_from_xml_bytes(xml_bytes)
+def has_white_in_xml(xml_bytes: bytes, xml_hash: bytes | None = None) -> bool:
+    ml = ml_per_m2_from_xml_bytes(xml_bytes, xml_hash)
     return (ml.get("White", 0.0) or 0.0) > 0.0
 
-def infer_mode_from_xml(xml_bytes: bytes):
-    _, _, _, meta = parse_xml(xml_bytes)
+def infer_mode_from_xml(xml_bytes: bytes, xml_hash: bytes | None = None):
+    return _cached_infer_mode(xml_hash or _xml_hash(xml_bytes), xml_bytes)
+
+def resolve_mode_key(mode_sel, xml_bytes: bytes, xml_hash: bytes | None = None):
+    """Modo selecionado se válido; senão o inferido do XML (uma leitura); senão o padrão."""
+    if mode_sel in PRINT_MODES:
+        return mode_sel
+    inferred = infer_mode_from_xml(xml_bytes, xml_hash)
+    return inferred if inferred in PRINT_MODES else DEFAULT_PRINT_MODE
+
+def _infer_mode_from_meta(meta: dict):
     res = str(meta.get("resolution") or "").lower().replace(" ", "").replace("x","×")
     spd = str(meta.get("print_speed") or "").lower()
     if   "800×400" in res: group = "Fast"
@@ -2032,57 +2446,99 @@ def infer_mode_from_xml(xml_bytes: bytes):
     qp = "Production" if "prod" in spd else "Quality"
     return f"{group} {qp}"
 
+_TPL_MODE_WHITE   = "{mode_key} — {res_color} (color) • " + WHITE_RES + " (white) • {speed}"
+_TPL_MODE_NOWHITE = "{mode_key} — {res_color} (color) • {speed}"
+
+@lru_cache(maxsize=256)
+def _mode_option_label_cached(mode_key: str, has_white: bool, unit_key: str, width_m: float) -> str:
+    tpl = _TPL_MODE_WHITE if has_white else _TPL_MODE_NOWHITE
+    return tpl.format(mode_key=mode_key, res_color=_MODE_RES_COLOR[mode_key],
+                      speed=speed_label(unit_key, _MODE_SPEED[mode_key], width_m))
+
 def mode_option_label(mode_key: str, has_white: bool, unit_key: str, width_m: float) -> str:
-    return f"{mode_key} — {PRINT_MODES[mode_key]['res_color']} (color){' • '+WHITE_RES+' (white)' if has_white else ''} • {speed_label(unit_key, PRINT_MODES[mode_key]['speed'], width_m)}"
+    # Sem largura em modo linear, speed_label cai no global_linear_width da sessão: não memoiza
+    if unit_key != "m2" and not width_m:
+        return _mode_option_label_cached.__wrapped__(mode_key, has_white, unit_key, width_m)
+    return _mode_option_label_cached(mode_key, bool(has_white), unit_key, float(width_m or 0.0))
 
 def apply_mode_factors(ml_map: dict, group: str, factors: dict) -> dict:
     g = factors.get(group, {"color":1.0,"white":1.0,"fof":1.0})
-    out = {}
-    for k, v in (ml_map or {}).items():
-        low = (k or "").lower()
-        if low in CHANNELS_WHITE: m = g["white"]
-        elif low in CHANNELS_FOF: m = g["fof"]
-        else: m = g["color"]
-        out[k] = float(v) * float(m)
-    return out
+    mults = (float(g["color"]), float(g["white"]), float(g["fof"]))
+    if mults == (1.0, 1.0, 1.0):
+        # Fatores neutros (100%): devolve o próprio mapa, sem copiar (nenhum chamador o altera)
+        return ml_map if ml_map is not None else {}
+    return {k: float(v) * mults[channel_class(k)] for k, v in (ml_map or {}).items()}
 
 # --- Per-mode scalers (state + UI + application) --------------------------
-def ensure_mode_multiplier_state():
-    ss = st.session_state
+_MODE_MUL_DEFAULTS: Mapping[str, float] = types.MappingProxyType({
     # Fast
-    ss.setdefault("single_mul_fc", 100.0)  # Fast — Color %
-    ss.setdefault("single_mul_fw", 100.0)  # Fast — White % (fixed 100% in logic)
-    ss.setdefault("single_mul_ff", 100.0)  # Fast — DuoSoft/FOF %
+    "single_mul_fc": 100.0,  # Fast — Color %
+    "single_mul_fw": 100.0,  # Fast — White % (fixed 100% in logic)
+    "single_mul_ff": 100.0,  # Fast — DuoSoft/FOF %
     # Standard
-    ss.setdefault("single_mul_sc", 110.0)  # initial suggestion
-    ss.setdefault("single_mul_sw", 100.0)
-    ss.setdefault("single_mul_sf", 105.0)
+    "single_mul_sc": 110.0,  # initial suggestion
+    "single_mul_sw": 100.0,
+    "single_mul_sf": 105.0,
     # Saturation
-    ss.setdefault("single_mul_tc", 125.0)
-    ss.setdefault("single_mul_tw", 100.0)
-    ss.setdefault("single_mul_tf", 110.0)
+    "single_mul_tc": 125.0,
+    "single_mul_tw": 100.0,
+    "single_mul_tf": 110.0,
+})
+
+def ensure_mode_multiplier_state():
+    ss = st.session_state
+    # Sentinela: semeia uma vez por sessão. Streamlit descarta a chave de widget não renderizado,
+    # então o fc também é conferido (e get_mode_factors_from_state lê com default).
+    if "_mode_mul_seeded" in ss and "single_mul_fc" in ss:
+        return
+    for k, v in _MODE_MUL_DEFAULTS.items():
+        if k not in ss:
+            ss[k] = v
+    ss["_mode_mul_seeded"] = True
+
+_MODE_FACTOR_KEYS = ("single_mul_fc", "single_mul_ff",
+                     "single_mul_sc", "single_mul_sw", "single_mul_sf",
+                     "single_mul_tc", "single_mul_tw", "single_mul_tf")
 
 def get_mode_factors_from_state() -> dict:
-    """Retorna fatores normalizados (1.00 = 100%)."""
+    """Retorna fatores normalizados (1.00 = 100%).
+    Reaproveita o dict anterior (mesmo objeto) enquanto os 8 sliders não mudam; tratar como somente leitura."""
     ensure_mode_multiplier_state()
-    return {
-        "fast": {
-            "color": (st.session_state["single_mul_fc"] or 100.0)/100.0,
-            # Fast — White is fixed at 100% (option removed from UI)
-            "white": 1.00,
-            "fof":   (st.session_state["single_mul_ff"] or 100.0)/100.0,
-        },
-        "standard": {
-            "color": (st.session_state["single_mul_sc"] or 100.0)/100.0,
-            "white": (st.session_state["single_mul_sw"] or 100.0)/100.0,
-            "fof":   (st.session_state["single_mul_sf"] or 100.0)/100.0,
-        },
-        "saturation": {
-            "color": (st.session_state["single_mul_tc"] or 100.0)/100.0,
-            "white": (st.session_state["single_mul_tw"] or 100.0)/100.0,
-            "fof":   (st.session_state["single_mul_tf"] or 100.0)/100.0,
-        },
+    ss = st.session_state
+    raw = tuple(ss.get(k, _MODE_MUL_DEFAULTS[k]) for k in _MODE_FACTOR_KEYS)
+    hit = ss.get("_mode_factors_cache")
+    if hit is not None and hit[0] == raw:
+        return hit[1]
+    vals = raw
+    if None in raw:  # sessões antigas/estado limpo fora do on_change
+        vals = tuple(100.0 if v is None else v for v in raw)
+    fc, ff, sc, sw, sf, tc, tw, tf = (v / 100.0 for v in vals)
+    factors = {
+        # Fast — White is fixed at 100% (option removed from UI)
+        "fast":       {"color": fc, "white": 1.00, "fof": ff},
+        "standard":   {"color": sc, "white": sw,   "fof": sf},
+        "saturation": {"color": tc, "white": tw,   "fof": tf},
     }
+    ss["_mode_factors_cache"] = (raw, factors)
+    return factors
+
+def _prefixed(prefix: str | None, name: str) -> str:
+    return f"{prefix}_{name}" if prefix else name
+
+# Presets de escaladores (Standard/Saturation): pares (chave, %)
+_PRESET_CONSERVATIVE = (
+    ("single_mul_sc", 110.0), ("single_mul_sw", 100.0), ("single_mul_sf", 105.0),
+    ("single_mul_tc", 120.0), ("single_mul_tw", 100.0), ("single_mul_tf", 108.0),
+)
+_PRESET_AGGRESSIVE = (
+    ("single_mul_sc", 120.0), ("single_mul_sw", 110.0), ("single_mul_sf", 110.0),
+    ("single_mul_tc", 135.0), ("single_mul_tw", 110.0), ("single_mul_tf", 112.0),
+)
+
+def _clamp_mode_scaler(key: str):
+    # on_change: campo esvaziado (None) volta a 100%; 0% digitado é respeitado
+    if st.session_state.get(key) is None:
+        st.session_state[key] = 100.0
 
 def render_mode_multiplier_controls(use_expander: bool = True, expanded: bool = False, show_presets: bool = True, key_prefix: str | None = None, sync_to_shared: bool = False):
     """Compact UI to edit per-mode scalers.
@@ -2103,38 +2559,25 @@ def render_mode_multiplier_controls(use_expander: bool = True, expanded: bool =
         # Extra note per request: Fast — White is fixed at 100%
         st.caption("Note: in the Fast group, White is fixed at 100% (no scaler).")
 
-        # Helper to resolve widget keys and seed values if using prefix
-        def _k(name: str) -> str:
-            return f"{key_prefix}_{name}" if key_prefix else name
-        # Seed prefixed widgets with shared values on first render
-        shared_keys = [
-            ("single_mul_fc", "Fast — Color %"),
-            ("single_mul_ff", "Fast — DuoSoft %"),
-            ("single_mul_sc", "Standard — Color %"),
-            ("single_mul_sw", "Standard — White %"),
-            ("single_mul_sf", "Standard — DuoSoft %"),
-            ("single_mul_tc", "Saturation — Color %"),
-            ("single_mul_tw", "Saturation — White %"),
-            ("single_mul_tf", "Saturation — DuoSoft %"),
-        ]
+        # Widget keys resolved once (prefixed or shared); seed prefixed widgets with shared values on first render
+        keys = {sk: _prefixed(key_prefix, sk) for sk in _MODE_FACTOR_KEYS}
         if key_prefix:
-            for sk, _ in shared_keys:
-                pk = _k(sk)
+            for sk, pk in keys.items():
                 if pk not in st.session_state:
                     st.session_state[pk] = float(st.session_state.get(sk, 100.0))
 
         f1,f3 = st.columns(2)
-        f1.number_input("Fast — Color %",     min_value=0.0, step=1.0, key=_k("single_mul_fc"), help="Fast: Color scaler (White fixed at 100%).")
+        f1.number_input("Fast — Color %",     min_value=0.0, step=1.0, key=keys["single_mul_fc"], on_change=_clamp_mode_scaler, args=(keys["single_mul_fc"],), help="Fast: Color scaler (White fixed at 100%).")
         # Fast — White removed by request; kept internally at 100%
-        f3.number_input("Fast — DuoSoft %",   min_value=0.0, step=1.0, key=_k("single_mul_ff"), help="Fast: DuoSoft/FOF scaler.")
+        f3.number_input("Fast — DuoSoft %",   min_value=0.0, step=1.0, key=keys["single_mul_ff"], on_change=_clamp_mode_scaler, args=(keys["single_mul_ff"],), help="Fast: DuoSoft/FOF scaler.")
         s1,s2,s3 = st.columns(3)
-        s1.number_input("Standard — Color %", min_value=0.0, step=1.0, key=_k("single_mul_sc"))
-        s2.number_input("Standard — White %", min_value=0.0, step=1.0, key=_k("single_mul_sw"))
-        s3.number_input("Standard — DuoSoft %",min_value=0.0, step=1.0, key=_k("single_mul_sf"))
+        s1.number_input("Standard — Color %", min_value=0.0, step=1.0, key=keys["single_mul_sc"], on_change=_clamp_mode_scaler, args=(keys["single_mul_sc"],))
+        s2.number_input("Standard — White %", min_value=0.0, step=1.0, key=keys["single_mul_sw"], on_change=_clamp_mode_scaler, args=(keys["single_mul_sw"],))
+        s3.number_input("Standard — DuoSoft %",min_value=0.0, step=1.0, key=keys["single_mul_sf"], on_change=_clamp_mode_scaler, args=(keys["single_mul_sf"],))
         t1,t2,t3 = st.columns(3)
-        t1.number_input("Saturation — Color %",min_value=0.0, step=1.0, key=_k("single_mul_tc"))
-        t2.number_input("Saturation — White %",min_value=0.0, step=1.0, key=_k("single_mul_tw"))
-        t3.number_input("Saturation — DuoSoft %",min_value=0.0, step=1.0, key=_k("single_mul_tf"))
+        t1.number_input("Saturation — Color %",min_value=0.0, step=1.0, key=keys["single_mul_tc"], on_change=_clamp_mode_scaler, args=(keys["single_mul_tc"],))
+        t2.number_input("Saturation — White %",min_value=0.0, step=1.0, key=keys["single_mul_tw"], on_change=_clamp_mode_scaler, args=(keys["single_mul_tw"],))
+        t3.number_input("Saturation — DuoSoft %",min_value=0.0, step=1.0, key=keys["single_mul_tf"], on_change=_clamp_mode_scaler, args=(keys["single_mul_tf"],))
 
         # Note: syncing back to shared keys is handled by callers (e.g., on Apply buttons)
 
@@ -2146,16 +2589,8 @@ def render_mode_multiplier_controls(use_expander: bool = True, expanded: bool =
                 key=f"{key_prefix or 'global'}_mul_preset"
             )
             def _apply_preset(conservador: bool):
-                vals = dict(
-                    single_mul_sc=110.0 if conservador else 120.0,
-                    single_mul_sw=100.0 if conservador else 110.0,
-                    single_mul_sf=105.0 if conservador else 110.0,
-                    single_mul_tc=120.0 if conservador else 135.0,
-                    single_mul_tw=100.0 if conservador else 110.0,
-                    single_mul_tf=108.0 if conservador else 112.0,
-                )
-                for sk, val in vals.items():
-                    st.session_state[_k(sk)] = val
+                for sk, val in (_PRESET_CONSERVATIVE if conservador else _PRESET_AGGRESSIVE):
+                    st.session_state[keys[sk]] = val
                 # Syncing to shared keys is deferred to caller (Apply buttons)
             if preset == "Conservador (+10C/+0W/+5FOF)":
                 _apply_preset(True)
@@ -2166,21 +2601,42 @@ def render_mode_multiplier_controls(use_expander: bool = True, expanded: bool =
 def sync_mode_scalers_from_prefix(prefix: str):
     """Copy values from prefixed widgets (e.g., 'cmpA_*') to the shared keys
     used in calculations (single_mul_*)."""
-    def _k(name: str) -> str:
-        return f"{prefix}_{name}"
-    mapping = [
-        "single_mul_fc","single_mul_ff",
-        "single_mul_sc","single_mul_sw","single_mul_sf",
-        "single_mul_tc","single_mul_tw","single_mul_tf",
-    ]
-    for sk in mapping:
-        pk = _k(sk)
+    for sk in _MODE_FACTOR_KEYS:
+        pk = f"{prefix}_{sk}"
         if pk in st.session_state:
             try:
                 st.session_state[sk] = float(st.session_state.get(pk, st.session_state.get(sk, 100.0)))
             except Exception:
                 st.session_state[sk] = st.session_state.get(pk, st.session_state.get(sk, 100.0))
 
+class ConsSource(IntEnum):
+    MANUAL = 0
+    XML = 1
+    XML_MODE = 2
+
+# Rótulos dos radios (EN + antigos PT) → fonte de consumo
+_SRC_LUT: Mapping[str, ConsSource] = types.MappingProxyType({
+    "manual": ConsSource.MANUAL,
+    "xml (exact)": ConsSource.XML,
+    "xml (exato)": ConsSource.XML,
+    "xml + mode multiplier (%)": ConsSource.XML_MODE,
+    "xml + mode multiplier": ConsSource.XML_MODE,
+    "xml + multiplicador de modo (%)": ConsSource.XML_MODE,
+})
+
+@lru_cache(maxsize=32)
+def cons_source_kind(label: str | None) -> ConsSource:
+    """Resolve a consumption-source label once; unknown labels follow the old prefix rules."""
+    low = str(label or "").strip().lower()
+    kind = _SRC_LUT.get(low)
+    if kind is not None:
+        return kind
+    if low.startswith("manual"):
+        return ConsSource.MANUAL
+    if low.startswith("xml"):
+        return ConsSource.XML_MODE if "mode" in low or "modo" in low else ConsSource.XML
+    return ConsSource.MANUAL
+
 def apply_consumption_source(
     xml_bytes: bytes,
     source: str,
@@ -2189,6 +2645,7 @@ def apply_consumption_source(
     man_color: float = 0.0,
     man_white: float = 0.0,
     man_fof: float   = 0.0,
+    xml_hash: bytes | None = None,
 ) -> dict:
     """
     Build the ml/m² map from the chosen source:
@@ -2196,13 +2653,13 @@ def apply_consumption_source(
     - "XML + mode multiplier (%)": XML consumption scaled by group (fast/standard/saturation)
     - "Manual": user-provided Color/White/FOF values
     """
-    src = (source or "").lower()
-    if src.startswith("manual"):
+    kind = cons_source_kind(source)
+    if kind is ConsSource.MANUAL:
         return {"Color": float(man_color or 0), "White": float(man_white or 0), "FOF": float(man_fof or 0)}
 
     # Base: XML
-    base = ml_per_m2_from_xml_bytes(xml_bytes)
-    if "mode" in src:  # "XML + mode multiplier (%)"
+    base = ml_per_m2_from_xml_bytes(xml_bytes, xml_hash)
+    if kind is ConsSource.XML_MODE:  # "XML + mode multiplier (%)"
         group = MODE_GROUP.get(mode_sel or "", None)
         if group:
             base = apply_mode_factors(base, group, factors)
@@ -2220,13 +2677,11 @@ def _simulate_core(unit_mode:str, width_m:float, length_m:float, waste_pct:float
     length_w = length_base_m * (1 + (waste_pct or 0)/100.0)
     qty_units = area_w if unit_mode=="m2" else length_w
 
-    color_ml = white_ml = fof_ml = 0.0
+    per_unit = 1.0 if unit_mode=="m2" else float(width_m or 0.0)
+    acc = [0.0, 0.0, 0.0]  # color, white, fof (índices de CHANNEL_CLASS)
     for k, v in (ml_map_m2 or {}).items():
-        v_unit = float(v) if unit_mode=="m2" else float(v) * float(width_m or 0.0)
-        low = (k or "").strip().lower()
-        if low in CHANNELS_WHITE: white_ml += v_unit
-        elif low in CHANNELS_FOF: fof_ml += v_unit
-        else: color_ml += v_unit
+        acc[channel_class(k)] += float(v) * per_unit
+    color_ml, white_ml, fof_ml = acc
 
     ink_cost_per_unit = (color_ml/1000.0)*(ink_color_per_l_usd or 0) + (white_ml/1000.0)*(ink_white_per_l_usd or 0)
     ink_cost_per_unit += (fof_ml/1000.0)*(fof_per_l_usd or 0)
@@ -2240,7 +2695,7 @@ def _simulate_core(unit_mode:str, width_m:float, length_m:float, waste_pct:float
     time_total_h = time_print_h + (post_h or 0.0)
 
     total_cost = cost_ink + cost_fabric + cost_other + cost_fixed
-    total_ml_per_unit = float(sum(ml_map_m2.values())) if unit_mode=="m2" else float(sum(ml_map_m2.values()))*float(width_m or 0.0)
+    total_ml_per_unit = color_ml + white_ml + fof_ml  # já por unidade (largura aplicada no loop)
     ink_ml_total = total_ml_per_unit * qty_units
 
     return dict(
@@ -2321,7 +2776,7 @@ def monthly_production_inputs(unit_key: str, unit_lbl: str, state_prefix: str) -
         prod_month_units = fxm2.number_input(
             f"Monthly production ({unit_lbl}/month)",
             min_value=0.0,
-            value=float(st.session_state.get(f"{state_prefix}_prod_month_units", DEFAULTS.get("prod_month_units", 30000.0))),
+            value=float(st.session_state.get(f"{state_prefix}_prod_month_units", DEFAULTS.prod_month_units)),
             step=100.0,
             help=f"Total produced per month in {unit_lbl}.",
             key=f"{state_prefix}_prod_units",
@@ -2350,6 +2805,10 @@ def fabric_total(res: dict) -> float:
     return float(res.get("cost_fabric", res.get("cost_media", 0.0)))
 
 # ---- Build table rows from simulate() result (used in Compare A×B)
+_COST_ROWS_TOT = (("Ink", False), ("Substrate", False), ("Other expenses", False),
+                  ("Variable", True), ("Fixed", True), ("Total", True))
+_COST_ROWS_UNIT = (("Variable", False), ("Fixed", False), ("Cost", True), ("Price", True))
+
 def build_cost_rows_from_sim(res, unit_lbl, sym, fx, price=None):
     """
     Returns (rows_tot, rows_unit) to be consumed by render_info_table().
@@ -2368,23 +2827,44 @@ def build_cost_rows_from_sim(res, unit_lbl, sym, fx, price=None):
     fixed_per_unit_card = fixed_cost / qty
     cost_unit_calc = total_cost / qty
 
-    rows_tot = [
-        ("Ink",            pretty_money(ink_total, sym, fx), False),
-        ("Substrate",      pretty_money(fabric_cost, sym, fx), False),
-        ("Other expenses", pretty_money(other_var, sym, fx), False),
-        ("Variable",       pretty_money(variable_total, sym, fx), True),
-        ("Fixed",          pretty_money(fixed_cost, sym, fx), True),
-        ("Total",          pretty_money(total_cost, sym, fx), True),
-    ]
-    rows_unit = [
-        ("Variable", pretty_money(variable_per_unit, sym, fx), False),
-        ("Fixed",    pretty_money(fixed_per_unit_card, sym, fx), False),
-        ("Cost",     pretty_money(cost_unit_calc, sym, fx), True),
-    ]
+    vals = [ink_total, fabric_cost, other_var, variable_total, fixed_cost, total_cost,
+            variable_per_unit, fixed_per_unit_card, cost_unit_calc]
     if price is not None:
-        rows_unit.append(("Price", pretty_money(price, sym, fx), True))
+        vals.append(price)
+    txt = pretty_money_many(vals, sym, fx)
+    rows_tot = [(lbl, t, bold) for (lbl, bold), t in zip(_COST_ROWS_TOT, txt[:6])]
+    rows_unit = [(lbl, t, bold) for (lbl, bold), t in zip(_COST_ROWS_UNIT, txt[6:])]
     return rows_tot, rows_unit
 # === Compare Option B: shared runner (reads inputs from state, writes panels)
+# Chaves lidas por run_compare_job: sufixo → default (o prefixo é 'cmpA'/'cmpB')
+_CMP_JOB_DEFAULTS: Mapping[str, object] = types.MappingProxyType({
+    "xml_sel": None, "mode_sel": None,
+    "width_m": 1.0, "length_m": 1.0, "waste": 0.0,
+    "cons_source": "XML (exact)", "man_c": 0.0, "man_w": 0.0, "man_f": 0.0,
+    "other_vars": None, "lab_h": 0.0,
+    "fix_mode": None, "fixed_unit": 0.0,
+    "fix_labor_month": 0.0, "fix_leasing_month": 0.0, "fix_depr_month": 0.0,
+    "fix_over_month": 0.0, "fix_others": None,
+    "fix_prod_month_units": DEFAULTS.prod_month_units,
+    "price": 0.0, "margin": 20.0, "tax": 10.0, "terms": 2.1, "round": 0.05,
+})
+_CMP_SHARED_DEFAULTS: Mapping[str, object] = types.MappingProxyType({
+    "cmp_ink_c": DEFAULTS.ink_color_per_l,
+    "cmp_ink_w": DEFAULTS.ink_white_per_l,
+    "cmp_fof": DEFAULTS.fof_per_l,
+    "cmp_fabric": DEFAULTS.fabric_per_unit,
+})
+
+@lru_cache(maxsize=8)
+def _cmp_job_keys(prefix: str) -> Tuple[Tuple[str, object], ...]:
+    pairs = [(f"{prefix}_{sfx}", d) for sfx, d in _CMP_JOB_DEFAULTS.items()]
+    return tuple(pairs) + tuple(_CMP_SHARED_DEFAULTS.items())
+
+def _cmp_job_snapshot(prefix: str) -> Dict[str, object]:
+    """Read every input of a compare job from session_state in one pass."""
+    ss = st.session_state
+    return {k: ss.get(k, d) for k, d in _cmp_job_keys(prefix)}
+
 def run_compare_job(prefix: str, label: str, uploaded_zip_bytes: bytes, sym: str, fx: float):
     """
     Executa a simulação para A ou B, lendo st.session_state pelos keys com prefixo
@@ -2410,17 +2890,19 @@ def run_compare_job(prefix: str, label: str, uploaded_zip_bytes: bytes, sym: str
     k_terms   = f"{prefix}_terms"
     k_round   = f"{prefix}_round"
 
+    snap = _cmp_job_snapshot(prefix)
+
     # Compartilhados do Compare
-    ink_c = float(st.session_state.get("cmp_ink_c",  DEFAULTS["ink_color_per_l"]))
-    ink_w = float(st.session_state.get("cmp_ink_w",  DEFAULTS["ink_white_per_l"]))
-    fof   = float(st.session_state.get("cmp_fof",    DEFAULTS["fof_per_l"]))
-    media = float(st.session_state.get("cmp_fabric", DEFAULTS["fabric_per_unit"]))
+    ink_c = float(snap["cmp_ink_c"])
+    ink_w = float(snap["cmp_ink_w"])
+    fof   = float(snap["cmp_fof"])
+    media = float(snap["cmp_fabric"])
 
     # Outros variáveis (por job) + mão de obra variável/h
-    other_vars_df = ensure_df(st.session_state.get(f"{prefix}_other_vars", [{"Name":"—","Value":0.0}]), ["Name","Value"])
+    other_vars_raw = snap[f"{prefix}_other_vars"]
 
     # XML do ZIP
-    xml_inner_path = st.session_state.get(k_xml)
+    xml_inner_path = snap[k_xml]
     if not xml_inner_path:
         _, xmls, *_ = read_zip_listing(uploaded_zip_bytes, cache_ns=prefix)
         xml_inner_path = xmls[0] if xmls else None
@@ -2428,63 +2910,59 @@ def run_compare_job(prefix: str, label: str, uploaded_zip_bytes: bytes, sym: str
         st.session_state[f"{prefix}_panels"] = {"error": "No XML in ZIP."}
         return
     xml_bytes = read_bytes_from_zip(uploaded_zip_bytes, xml_inner_path, cache_ns=prefix)
+    xml_hash = _xml_hash(xml_bytes)
 
     # Fatores (usa os sliders compartilhados)
     factors = get_mode_factors_from_state()
 
     # Base de consumo (com possível multiplicador de modo)
-    mlmap_use = apply_consumption_source(
-        xml_bytes,
-        st.session_state.get(k_cons, "XML (exact)"),
-        st.session_state.get(k_mode),
-        factors,
-        st.session_state.get(k_man_c, 0.0),
-        st.session_state.get(k_man_w, 0.0),
-        st.session_state.get(k_man_f, 0.0),
-    )
-
-    # Fallback: se a fonte é XML e o mapa tem só White/FOF, tenta primeiro XML com cores
-    if str(st.session_state.get(k_cons, "XML (exact)")).lower().startswith("xml") and not has_color_channels(mlmap_use):
-        fb = pick_first_with_colors(uploaded_zip_bytes, cache_ns=prefix)
-        if fb:
-            if "mode" in str(st.session_state.get(k_cons, "")).lower():
-                group_key = MODE_GROUP.get(st.session_state.get(k_mode), "")
-                mlmap_use = apply_mode_factors(fb, group_key, factors)
-            else:
+    src_kind = cons_source_kind(snap[k_cons])
+    if src_kind is ConsSource.MANUAL:
+        mlmap_use = apply_consumption_source(
+            xml_bytes, snap[k_cons], snap[k_mode], factors,
+            snap[k_man_c], snap[k_man_w], snap[k_man_f],
+        )
+    else:
+        # Mapa cru do XML; o multiplicador de modo é aplicado uma única vez, depois do fallback
+        mlmap_use = ml_per_m2_from_xml_bytes(xml_bytes, xml_hash)
+        # Fallback: se a fonte é XML e o mapa tem só White/FOF, tenta primeiro XML com cores
+        if not has_color_channels(mlmap_use):
+            fb = pick_first_with_colors(uploaded_zip_bytes, cache_ns=prefix)
+            if fb:
                 mlmap_use = fb
+        if src_kind is ConsSource.XML_MODE:
+            mlmap_use = apply_mode_factors(mlmap_use, MODE_GROUP.get(snap[k_mode], "standard"), factors)
 
-    width_m  = float(st.session_state.get(k_width,  1.0))
-    length_m = float(st.session_state.get(k_length, 1.0))
-    waste    = float(st.session_state.get(k_waste,  0.0))
+    width_m  = float(snap[k_width])
+    length_m = float(snap[k_length])
+    waste    = float(snap[k_waste])
     # Resolve speed from a robust mode key
-    _mode_key = st.session_state.get(k_mode)
-    if _mode_key not in PRINT_MODES:
-        _mode_key = infer_mode_from_xml(xml_bytes) if infer_mode_from_xml(xml_bytes) in PRINT_MODES else (list(PRINT_MODES.keys())[0] if PRINT_MODES else None)
-    speed    = PRINT_MODES.get(_mode_key, {}).get("speed", 0.0)
+    _mode_key = resolve_mode_key(snap[k_mode], xml_bytes, xml_hash)
+    speed    = _MODE_SPEED.get(_mode_key, 0.0)
 
     # Mão de obra variável -> por unidade
-    labor_h = float(st.session_state.get(f"{prefix}_lab_h", 0.0))
+    labor_h = float(snap[f"{prefix}_lab_h"])
     if UNIT == "m2":
         labor_var_per_unit = labor_h / max(1e-9, speed)
     else:
         m_per_h = speed / max(1e-9, width_m)
         labor_var_per_unit = labor_h / max(1e-9, m_per_h)
 
-    other_vars_sum = float(other_vars_df["Value"].fillna(0).sum()) + labor_var_per_unit
+    other_vars_sum = _sum_value_column(other_vars_raw) + labor_var_per_unit
 
     # Fixed allocation: direct vs monthly helper
-    fix_mode_val = (st.session_state.get(f"{prefix}_fix_mode") or "Direct per unit")
+    fix_mode_val = (snap[f"{prefix}_fix_mode"] or "Direct per unit")
     if str(fix_mode_val).lower().startswith("monthly"):
-        fix_labor_m   = float(st.session_state.get(f"{prefix}_fix_labor_month", 0.0))
-        fix_leasing_m = float(st.session_state.get(f"{prefix}_fix_leasing_month", 0.0))
-        fix_depr_m    = float(st.session_state.get(f"{prefix}_fix_depr_month", 0.0))
-        fix_over_m    = float(st.session_state.get(f"{prefix}_fix_over_month", 0.0))
-        fix_others_df = ensure_df(st.session_state.get(f"{prefix}_fix_others", [{"Name":"—","Value":0.0}]), ["Name","Value"])
-        fix_others_m  = float(fix_others_df["Value"].fillna(0).sum())
-        prod_month_u  = float(st.session_state.get(f"{prefix}_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30000.0)))
-        fixed_per_unit_used = (fix_labor_m + fix_leasing_m + fix_depr_m + fix_over_m + fix_others_m) / prod_month_u if prod_month_u > 0 else 0.0
+        fix_labor_m   = float(snap[f"{prefix}_fix_labor_month"])
+        fix_leasing_m = float(snap[f"{prefix}_fix_leasing_month"])
+        fix_depr_m    = float(snap[f"{prefix}_fix_depr_month"])
+        fix_over_m    = float(snap[f"{prefix}_fix_over_month"])
+        fix_others_m  = _sum_value_column(snap[f"{prefix}_fix_others"])
+        prod_month_u  = float(snap[f"{prefix}_fix_prod_month_units"])
+        fix_month_tot = math.fsum((fix_labor_m, fix_leasing_m, fix_depr_m, fix_over_m, fix_others_m))
+        fixed_per_unit_used = fix_month_tot / prod_month_u if prod_month_u > 0 else 0.0
     else:
-        fixed_per_unit_used = float(st.session_state.get(k_fixed, 0.0))
+        fixed_per_unit_used = float(snap[k_fixed])
 
     res = simulate(
         UNIT, width_m, length_m, waste,
@@ -2507,14 +2985,13 @@ def run_compare_job(prefix: str, label: str, uploaded_zip_bytes: bytes, sym: str
     cost_unit_calc = total_cost / qty
 
     # Precificação
-    margin = float(st.session_state.get(k_margin, 20.0))
-    tax    = float(st.session_state.get(k_tax,    10.0))
-    terms  = float(st.session_state.get(k_terms,   2.1))
-    rnd    = float(st.session_state.get(k_round,  0.05))
-    price_input = float(st.session_state.get(k_price, 0.0))
-
-    suggested   = price_round(cost_unit_calc*(1 + margin/100 + tax/100), rnd)
-    suggested   = price_round(suggested*(1 + terms/100), rnd)
+    margin = float(snap[k_margin])
+    tax    = float(snap[k_tax])
+    terms  = float(snap[k_terms])
+    rnd    = float(snap[k_round])
+    price_input = float(snap[k_price])
+
+    suggested   = _suggest_price(cost_unit_calc, margin, tax, terms, rnd)
     effective_price = price_input if price_input>0 else suggested
 
     rows_tot, rows_unit = build_cost_rows_from_sim(res, unit_lbl, sym, fx, price=effective_price)
@@ -2543,6 +3020,77 @@ def run_compare_job(prefix: str, label: str, uploaded_zip_bytes: bytes, sym: str
 # =========================
 # A×B PDF — robusto a canais faltantes
 # =========================
+def _wrap_chars(s: str, width: int) -> str:
+    """textwrap.fill for header names: a name with no spaces/hyphens is one long word, which
+    textwrap cuts every `width` chars, so slice directly; otherwise defer to textwrap."""
+    if any(ch.isspace() or ch == "-" for ch in s):
+        return textwrap.fill(s, width=width)
+    return "\n".join(s[i:i + width] for i in range(0, len(s), width))
+
+_PDF_SPOOL_MAX = 2 * 1024 * 1024  # acima disso o PDF em construção vai para arquivo temporário
+
+@st.cache_resource(show_spinner=False)
+def _pdf_fig_slot():
+    # Uma Figure A4 por processo, fora do pyplot (sem gerenciador de figuras); o lock serializa os builders
+    from matplotlib.figure import Figure
+    # dpi só afeta o que é rasterizado (as miniaturas 320×180/360×200); barras, texto e tabela seguem vetoriais
+    return Figure(figsize=(8.27, 11.69), dpi=110), threading.Lock()
+
+@contextmanager
+def _pdf_figure():
+    fig, lock = _pdf_fig_slot()
+    with lock:
+        fig.clf()
+        try:
+            yield fig
+        finally:
+            fig.clf()
+
+@st.cache_resource(show_spinner=False)
+def _thumb_pool() -> ThreadPoolExecutor:
+    # Um pool por processo (o script re-executa a cada rerun; um global de módulo vazaria threads)
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-thumb")
+
+def _run_with_ctx(ctx, fn, *args):
+    # Propaga o ScriptRunContext para a thread do pool (st.cache_data exige contexto) e limpa ao final
+    th = threading.current_thread()
+    add_script_run_ctx(th, ctx)
+    try:
+        return fn(*args)
+    finally:
+        add_script_run_ctx(th, None)
+
+@st.cache_data(max_entries=32, ttl=3600, show_spinner=False)
+def _pdf_thumb_cached(zip_digest: str, selected_channel: str | None, max_side: int,
+                      thumb_w: int, thumb_h: int, _zbytes: bytes, _cache_ns: str | None = None) -> PILImageType | None:
+    """Preview thumbnail for the PDFs, shared by the Single and A×B builders (key: ZIP digest + sizes).
+    _cache_ns (not part of the key) reuses the listing/entries the job forms already cached."""
+    try:
+        files, xmls, jpgs, tifs, _ = _cached_zip_listing(_cache_ns or "zip", zip_digest, _zbytes)
+        cmap = {}
+        for p in tifs:
+            chn = get_channel_from_filename(p.split("/")[-1])
+            if chn:
+                cmap[chn] = p
+        sel = selected_channel or "Preview"
+        path, typ = choose_path(sel, jpgs, cmap)
+        if not path:
+            path = jpgs[0] if jpgs else (tifs[0] if tifs else None)
+            if not path:
+                return None
+        if path.lower().endswith((".jpg", ".jpeg")):
+            # JPEG: draft() deixa o libjpeg decodificar já reduzido (1/2, 1/4, 1/8) e o letterbox faz um único resize
+            with _open_preview_stream(_zbytes, path, zip_digest) as f:
+                im = Image.open(f)
+                im.draft("RGB", (thumb_w * 2, thumb_h * 2))
+                im.load()
+        else:
+            im = load_preview_light(_zbytes, path, max_side=max_side, cache_ns=_cache_ns)
+        # Devolve a própria imagem PIL (RGB): o imshow aceita direto, sem um np.asarray extra aqui
+        return letterbox(im, thumb_w, thumb_h)
+    except Exception:
+        return None
+
 @st.cache_data(show_spinner=False)
 def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: List[float],
                                     mlA_map: dict, mlB_map: dict,
@@ -2569,9 +3117,25 @@ def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: Li
     totalA = float(sum(yA)); totalB = float(sum(yB))
     delta_pct = 0.0 if totalA==0 else (totalB-totalA)/totalA*100.0
 
-    buf = io.BytesIO()
-    with PdfPages(buf) as pdf:
-        fig = plt.figure(figsize=(8.27,11.69), dpi=150)  # A4 retrato
+    # Optional thumbnails (small previews) — carregadas antes de pegar a figura compartilhada,
+    # para o lock de _pdf_figure cobrir só o desenho e o savefig
+    def _load_thumb(zbytes: bytes | None, cache_ns: str | None = None) -> PILImageType | None:
+        if not zbytes:
+            return None
+        return _pdf_thumb_cached(_zip_digest(zbytes), selected_channel, 420, 320, 180, zbytes, cache_ns)
+
+    if zA_bytes and zB_bytes:
+        # A e B em paralelo: zlib e os decoders do Pillow liberam o GIL
+        ctx = get_script_run_ctx()
+        futA = _thumb_pool().submit(_run_with_ctx, ctx, _load_thumb, zA_bytes, "cmpA")
+        futB = _thumb_pool().submit(_run_with_ctx, ctx, _load_thumb, zB_bytes, "cmpB")
+        imgA, imgB = futA.result(), futB.result()
+    else:
+        imgA = _load_thumb(zA_bytes, "cmpA") if zA_bytes else None
+        imgB = _load_thumb(zB_bytes, "cmpB") if zB_bytes else None
+
+    buf = tempfile.SpooledTemporaryFile(max_size=_PDF_SPOOL_MAX)  # PDFs grandes vão para disco
+    with _pdfpages()(buf) as pdf, _pdf_figure() as fig:  # A4 retrato
         fig.suptitle(f"A × B Comparison — Consumption per Channel ({cons_label})", fontsize=16, fontweight="bold", y=0.98)
         fig.text(0.08, 0.955, dt.datetime.now().strftime("%Y-%m-%d %H:%M"), fontsize=9, color="#7aa4ff")
         # Labels (use file names if provided)
@@ -2580,36 +3144,12 @@ def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: Li
         def _short(s: str, maxlen: int = 28) -> str:
             s = (s or "").split("/")[-1]
             return s if len(s) <= maxlen else (s[:maxlen-1] + "…")
+        shortA, shortB = _short(nameA), _short(nameB)
         # Totals moved to previews (optional)
         # Move %Δ up to avoid overlapping previews
         fig.text(0.92, 0.955, f"%Δ vs A: {delta_pct:+.1f}%", fontsize=12,
                  color=("#2E7D32" if delta_pct<=0 else "#C62828"), ha='right')
 
-        # Optional thumbnails (small previews)
-        def _load_thumb(zbytes: bytes | None) -> np.ndarray | None:
-            try:
-                if not zbytes:
-                    return None
-                files, xmls, jpgs, tifs, _ = read_zip_listing(zbytes)
-                cmap = {}
-                for p in tifs:
-                    ch = get_channel_from_filename(p.split("/")[-1])
-                    if ch:
-                        cmap[ch] = p
-                sel = selected_channel or "Preview"
-                path, typ = choose_path(sel, jpgs, cmap)
-                if not path:
-                    path = jpgs[0] if jpgs else (tifs[0] if tifs else None)
-                    if not path:
-                        return None
-                im = load_preview_light(zbytes, path, max_side=420)
-                thumb = letterbox(im, 320, 180)
-                return np.asarray(thumb)
-            except Exception:
-                return None
-
-        imgA = _load_thumb(zA_bytes)
-        imgB = _load_thumb(zB_bytes)
         # Layout presets for preview & charts
         pz = (preview_size or "M").upper()
         if pz == "S":
@@ -2649,33 +3189,36 @@ def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: Li
         ax1 = fig.add_axes(bars_rect)
         x = np.arange(len(ch)); width = 0.38
         colors = [CHANNEL_COLORS.get(c,"#888") for c in ch]
-        bars1 = ax1.bar(x - width/2, yA, width, color=colors, label=_short(nameA))
-        bars2 = ax1.bar(x + width/2, yB, width, color=colors, hatch="//", edgecolor="black", linewidth=0.6, alpha=0.85, label=_short(nameB))
+        bars1 = ax1.bar(x - width/2, yA, width, color=colors, label=shortA)
+        bars2 = ax1.bar(x + width/2, yB, width, color=colors, hatch="//", edgecolor="black", linewidth=0.6, alpha=0.85, label=shortB)
         ax1.set_xticks(x); ax1.set_xticklabels(ch)
         ax1.set_ylabel(cons_label); ax1.set_title(f"Clustered bars ({cons_label})")
         ax1.legend(loc="upper right", frameon=False)
         ymax = max([*yA,*yB,1e-9])*1.15; ax1.set_ylim(0, ymax)
-        for b in list(bars1)+list(bars2):
-            h = b.get_height()
-            if h>0: ax1.text(b.get_x()+b.get_width()/2, h, f"{h:.2f}", ha="center", va="bottom", fontsize=6)
+        ax1.bar_label(bars1, labels=[f"{v:.2f}" if v > 0 else "" for v in yA], fontsize=6, padding=1)
+        ax1.bar_label(bars2, labels=[f"{v:.2f}" if v > 0 else "" for v in yB], fontsize=6, padding=1)
 
         # 100% composition (optional)
         if show_comp:
             ax2 = fig.add_axes(comp_rect)
-            x2 = np.array([0,1]); bottoms = np.array([0.0,0.0])
-            for c in ch:
-                shareA = 0 if totalA==0 else (mlA_map.get(c,0.0)/totalA*100.0 if totalA else 0)
-                shareB = 0 if totalB==0 else (mlB_map.get(c,0.0)/totalB*100.0 if totalB else 0)
-                ax2.bar(x2, [shareA,shareB], bottom=bottoms, color=CHANNEL_COLORS.get(c,"#888"), label=c)
-                bottoms += np.array([shareA,shareB])
-            ax2.set_xticks(x2); ax2.set_xticklabels([_short(nameA), _short(nameB)])
+            x2 = np.array([0,1])
+            # shares[j, i]: % do canal i no job j (A=0, B=1); bases empilhadas via cumsum
+            shares = np.fromiter((float(m.get(c, 0.0)) for m in (mlA_map, mlB_map) for c in ch),
+                                 dtype=np.float64, count=2 * len(ch)).reshape(2, len(ch))
+            tots = np.array([[totalA], [totalB]], dtype=np.float64)
+            shares = np.divide(shares * 100.0, tots, out=np.zeros_like(shares), where=tots != 0)
+            bottoms = np.cumsum(shares, axis=1) - shares
+            for i, c in enumerate(ch):
+                ax2.bar(x2, shares[:, i], bottom=bottoms[:, i], color=colors[i], label=c)
+            ax2.set_xticks(x2); ax2.set_xticklabels([shortA, shortB])
             ax2.set_ylabel("% of total"); ax2.set_title("100% composition")
             ax2.set_ylim(0,100)
             ax2.legend(ncol=4, bbox_to_anchor=(0.0,-0.55,1.0,.102), loc="upper left", frameon=False, fontsize=7)
 
         # Tabela
-        diff = [b-a for a,b in zip(yA,yB)]
-        pct  = [ (0.0 if a==0 else (b-a)/a*100.0) for a,b in zip(yA,yB) ]
+        yAa = np.asarray(yA, dtype=np.float64); yBa = np.asarray(yB, dtype=np.float64)
+        diff = yBa - yAa
+        pct  = np.divide(diff * 100.0, yAa, out=np.zeros_like(diff), where=yAa != 0)
         ax3 = fig.add_axes(table_rect); ax3.axis("off")
         # Build header labels with smart wrapping to avoid overlap
         def _wrap_width_for(name: str) -> int:
@@ -2685,25 +3228,25 @@ def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: Li
             if L > 38: return 22
             if L > 30: return 24
             return 26
-        def _wrap_name_for_header(name: str, width: int | None = None) -> str:
-            base = _short(name, 56)
-            w = width if width else _wrap_width_for(base)
-            return textwrap.fill(base, width=w) + f"\n({cons_label})"
+        # Nomes-base, larguras de quebra e nº de linhas calculados uma vez (cabeçalho, larguras e alturas)
+        baseA = _short(nameA, 56); baseB = _short(nameB, 56)
+        wA = _wrap_width_for(baseA); wB = _wrap_width_for(baseB)
+        linesA = max(1, math.ceil(len(baseA) / wA))
+        linesB = max(1, math.ceil(len(baseB) / wB))
         col_labels = [
             "Channel",
-            _wrap_name_for_header(nameA),
-            _wrap_name_for_header(nameB),
+            _wrap_chars(baseA, wA) + f"\n({cons_label})",
+            _wrap_chars(baseB, wB) + f"\n({cons_label})",
             "Δ (B−A)",
             "%Δ vs A",
         ]
-        cell_text = [[c, f"{yA[i]:.2f}", f"{yB[i]:.2f}", f"{diff[i]:+.2f}", f"{pct[i]:+.1f}%"] for i,c in enumerate(ch)]
+        cell_text = [[c, f"{a:.2f}", f"{b:.2f}", f"{d:+.2f}", f"{p:+.1f}%"] for c, a, b, d, p in zip(ch, yAa, yBa, diff, pct)]
         # Total row
         cell_text.append(["Total", f"{totalA:.2f}", f"{totalB:.2f}", f"{(totalB-totalA):+.2f}", f"{delta_pct:+.1f}%"])
         # Column widths tuned to avoid header overlap
         if len(col_labels) == 5:
             # Allocate most width to A/B; Δ and %Δ compact; Channel smaller
             # Distribute A/B width based on name lengths (bounded 40–60%)
-            baseA = _short(nameA, 56); baseB = _short(nameB, 56)
             lenA = max(1, len(baseA)); lenB = max(1, len(baseB))
             shareA = min(0.60, max(0.40, lenA/(lenA+lenB)))
             total_ab = 0.68
@@ -2715,40 +3258,26 @@ def build_comparison_pdf_matplotlib(channels: List[str], yA: List[float], yB: Li
         table = ax3.table(cellText=cell_text, colLabels=col_labels, colWidths=col_widths, loc="center")
         table.auto_set_font_size(False)
         table.set_fontsize(6.5)
-        table.scale(1.03, 1.12)
-        # Center align all text to reduce clipping
-        for (r, c), cell in table.get_celld().items():
-            cell.get_text().set_ha('center')
-            cell.get_text().set_va('center')
+        # Body rows: the extra 1.18 stretch is folded into the global scale
+        table.scale(1.03, 1.12 * 1.18)
         # Increase header row height for more breathing room (names + unit)
         # and adapt header font size to very long names
-        baseA = _short(nameA, 56)
-        baseB = _short(nameB, 56)
-        linesA = max(1, math.ceil(len(baseA) / _wrap_width_for(baseA)))
-        linesB = max(1, math.ceil(len(baseB) / _wrap_width_for(baseB)))
         max_lines = max(linesA, linesB)
         hdr_factor = 1.60 + max(0, (max_lines - 2)) * 0.15  # grows for 3+ lines
         hdr_font = 6.1 if max_lines <= 2 else (5.8 if max_lines == 3 else 5.5)
-        try:
-            # Increase all row heights slightly, and header a bit more
-            ncols = len(col_labels)
-            # Determine total rows by probing indices in cell dict
-            rows = [r for (r, _c) in table.get_celld().keys()]
-            max_r = max(rows) if rows else 0
-            for r in range(max_r + 1):
-                for c in range(ncols):
-                    cell = table[(r, c)]
-                    h = cell.get_height()
-                    if r == 0:
-                        cell.set_height(h * hdr_factor)
-                        cell.get_text().set_fontsize(hdr_font)
-                    else:
-                        cell.set_height(h * 1.18)
-        except Exception:
-            pass
-
-        pdf.savefig(fig, bbox_inches="tight"); plt.close(fig)
-    return buf.getvalue()
+        # Center align all text to reduce clipping; only header cells get a height override
+        for (r, c), cell in table.get_celld().items():
+            txt = cell.get_text()
+            txt.set_ha('center'); txt.set_va('center')
+            if r == 0:
+                cell.set_height(cell.get_height() * hdr_factor / 1.18)
+                txt.set_fontsize(hdr_font)
+
+        pdf.savefig(fig)  # eixos já posicionados via add_axes: sem a passada extra do bbox 'tight'
+    buf.seek(0)
+    data = buf.read()
+    buf.close()
+    return data
 
 # =========================
 # Compare — Job inputs (module-level helper)
@@ -2911,7 +3440,7 @@ def compare_job_inputs(prefix: str, label: str, zbytes: bytes):
             # Monthly production helper
             prod_m = monthly_production_inputs(get_unit(), unit_label_short(get_unit()), state_prefix=f"{prefix}_fix")
             # Allocation
-            sum_others = ensure_df(st.session_state.get(f"{prefix}_fix_others", []), ["Name","Value"]).get("Value", pd.Series(dtype=float)).fillna(0).sum() if st.session_state.get(f"{prefix}_fix_others") else 0.0
+            sum_others = _sum_value_column(st.session_state.get(f"{prefix}_fix_others"))
             total_fix_m = (
                 float(st.session_state.get(f"{prefix}_fix_labor_month", 0.0))
                 + float(st.session_state.get(f"{prefix}_fix_leasing_month", 0.0))
@@ -2932,7 +3461,7 @@ def compare_job_inputs(prefix: str, label: str, zbytes: bytes):
             with st_div("ink-fixed-grid"):
                 st.columns(1)[0].selectbox("Round to", ["0.01", "0.05", "0.10"], index={"0.01":0,"0.05":1,"0.10":2}.get(str(st.session_state.get(f"{prefix}_round", 0.05)),1), key=f"{prefix}_round", help="Rounding step for suggested price.")
     if do_compute:
-        if str(st.session_state.get(f"{prefix}_cons_source", "")).startswith("XML + mode"):
+        if cons_source_kind(st.session_state.get(f"{prefix}_cons_source")) is ConsSource.XML_MODE:
             sync_mode_scalers_from_prefix(prefix)
         st.success(f"{label} saved. Now click 'Calculate A and B'.")
     else:
@@ -2958,9 +3487,14 @@ def build_single_pdf_matplotlib(channels: List[str], y: List[float], ml_map: dic
 
     total = float(sum(y))
 
-    buf = io.BytesIO()
-    with PdfPages(buf) as pdf:
-        fig = plt.figure(figsize=(8.27,11.69), dpi=150)
+    # Preview — carregado fora do lock da figura compartilhada
+    def _load_thumb(zb: bytes | None, cache_ns: str | None = None) -> PILImageType | None:
+        if not zb: return None
+        return _pdf_thumb_cached(_zip_digest(zb), selected_channel, 420, 360, 200, zb, cache_ns)
+    img = _load_thumb(z_bytes, "single") if z_bytes else None
+
+    buf = tempfile.SpooledTemporaryFile(max_size=_PDF_SPOOL_MAX)  # PDFs grandes vão para disco
+    with _pdfpages()(buf) as pdf, _pdf_figure() as fig:
         fig.suptitle(f"Single — Consumption per Channel ({cons_label})", fontsize=16, fontweight="bold", y=0.98)
         fig.text(0.08, 0.955, dt.datetime.now().strftime("%Y-%m-%d %H:%M"), fontsize=9, color="#7aa4ff")
         name = (label or "Job")
@@ -2987,25 +3521,6 @@ def build_single_pdf_matplotlib(channels: List[str], y: List[float], ml_map: dic
             table_rect= [0.06, 0.06, 0.88, 0.26] if show_comp else [0.06, 0.06, 0.88, 0.31]
 
         # Preview
-        def _load_thumb(zb: bytes | None) -> np.ndarray | None:
-            try:
-                if not zb: return None
-                files, xmls, jpgs, tifs, _ = read_zip_listing(zb)
-                cmap = {}
-                for p in tifs:
-                    chn = get_channel_from_filename(p.split("/")[-1])
-                    if chn: cmap[chn] = p
-                sel = selected_channel or "Preview"
-                path, typ = choose_path(sel, jpgs, cmap)
-                if not path:
-                    path = jpgs[0] if jpgs else (tifs[0] if tifs else None)
-                    if not path: return None
-                im = load_preview_light(zb, path, max_side=420)
-                thumb = letterbox(im, 360, 200)
-                return np.asarray(thumb)
-            except Exception:
-                return None
-        img = _load_thumb(z_bytes)
         if img is not None:
             axp = fig.add_axes(prev_rect)
             axp.imshow(img)
@@ -3024,18 +3539,19 @@ def build_single_pdf_matplotlib(channels: List[str], y: List[float], ml_map: dic
         ax1.set_ylabel(cons_label); ax1.set_title(f"Per-channel consumption ({cons_label})")
         ax1.legend(loc="upper right", frameon=False)
         ymax = max([*y, 1e-9]) * 1.15; ax1.set_ylim(0, ymax)
-        for b in bars:
-            h = b.get_height()
-            if h>0: ax1.text(b.get_x()+b.get_width()/2, h, f"{h:.2f}", ha="center", va="bottom", fontsize=7)
+        ax1.bar_label(bars, labels=[f"{v:.2f}" if v > 0 else "" for v in y], fontsize=7, padding=1)
+
+        # % do total por canal (composição + tabela)
+        shares = np.fromiter((float(ml_map.get(c, 0.0)) for c in ch), dtype=np.float64, count=len(ch))
+        shares = shares / total * 100.0 if total else np.zeros_like(shares)
 
         # 100% composition
         if show_comp:
             ax2 = fig.add_axes(comp_rect)
-            x2 = np.array([0]); bottom = 0.0
-            for c in ch:
-                share = 0 if total==0 else (ml_map.get(c,0.0)/total*100.0)
-                ax2.bar(x2, [share], bottom=[bottom], color=CHANNEL_COLORS.get(c,"#888"), label=c)
-                bottom += share
+            x2 = np.array([0])
+            bottoms = np.cumsum(shares) - shares
+            for i, c in enumerate(ch):
+                ax2.bar(x2, [shares[i]], bottom=[bottoms[i]], color=colors[i], label=c)
             ax2.set_xticks(x2); ax2.set_xticklabels([_short(name)])
             ax2.set_ylabel("% of total"); ax2.set_title("100% composition")
             ax2.set_ylim(0,100)
@@ -3051,38 +3567,96 @@ def build_single_pdf_matplotlib(channels: List[str], y: List[float], ml_map: dic
             return 26
         def _wrap_name(n: str) -> str:
             base = _short(n, 56)
-            return textwrap.fill(base, width=_wrap_width_for(base)) + f"\n({cons_label})"
+            return _wrap_chars(base, _wrap_width_for(base)) + f"\n({cons_label})"
         col_labels = ["Channel", _wrap_name(name), "% of total"]
-        pct = [ (0.0 if total==0 else (ml_map.get(c,0.0)/total*100.0)) for c in ch ]
-        cell_text = [[c, f"{y[i]:.2f}", f"{pct[i]:.1f}%"] for i,c in enumerate(ch)]
+        cell_text = [[c, f"{v:.2f}", f"{p:.1f}%"] for c, v, p in zip(ch, y, shares)]
         # Total row
         cell_text.append(["Total", f"{total:.2f}", "100.0%"])
         col_widths = [0.22, 0.54, 0.24]
         table = ax3.table(cellText=cell_text, colLabels=col_labels, colWidths=col_widths, loc='center')
         table.auto_set_font_size(False)
         table.set_fontsize(6.6)
-        table.scale(1.03, 1.12)
+        table.scale(1.03, 1.12 * 1.12)  # body stretch folded into the global scale
         for (r,c), cell in table.get_celld().items():
-            cell.get_text().set_ha('center'); cell.get_text().set_va('center')
-        try:
-            ncols = len(col_labels)
-            rows = [r for (r,_c) in table.get_celld().keys()]
-            max_r = max(rows) if rows else 0
-            for r in range(max_r+1):
-                for c in range(ncols):
-                    cell = table[(r,c)]
-                    h = cell.get_height()
-                    if r == 0:
-                        cell.set_height(h*1.55)
-                        # smaller header font for long names
-                        cell.get_text().set_fontsize(6.0)
-                    else:
-                        cell.set_height(h*1.12)
-        except Exception:
-            pass
+            txt = cell.get_text()
+            txt.set_ha('center'); txt.set_va('center')
+            if r == 0:
+                cell.set_height(cell.get_height()*1.55/1.12)
+                # smaller header font for long names
+                txt.set_fontsize(6.0)
+
+        pdf.savefig(fig)
+    buf.seek(0)
+    data = buf.read()
+    buf.close()
+    return data
+
+# Figuras do Compare A×B cacheadas como objeto go.Figure (cache_resource, sem cópia): reruns com as mesmas
+# entradas não reconstroem nem revalidam a figura. Compartilhadas entre sessões — somente leitura, nunca alterar.
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _build_bar_fig(labels: tuple, values: tuple, colors: tuple, height: int, y_title: str, text_fmt: str | None = None) -> go.Figure:
+    y = np.asarray(values, dtype=float)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=list(labels), y=y, marker=dict(color=list(colors)),
+        text=[format(v, text_fmt) for v in y] if text_fmt else None,
+        textposition="outside" if text_fmt else None,
+        cliponaxis=False if text_fmt else None,
+    ))
+    fig.update_layout(
+        template="plotly_white",
+        height=height,
+        margin=dict(l=10, r=10, t=30, b=10),
+        yaxis_title=y_title,
+        xaxis_title="Channel",
+    )
+    return fig
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _build_cmp_fig(ch_order: tuple, yA: tuple, yB: tuple, colors: tuple, show_vals: bool, y_label: str,
+                   height: int, nameA: str, nameB: str) -> go.Figure:
+    fmt = ".1f" if y_label.startswith("%") else ".2f"
+    suffix = "%" if y_label.startswith("%") else ""
+    fig = go.Figure()
+    # Job A — sólido
+    fig.add_trace(
+        go.Bar(
+            name=nameA,
+            x=list(ch_order),
+            y=np.asarray(yA, dtype=float),
+            marker=dict(color=list(colors)),
+            text=[format(v, fmt) + suffix for v in yA] if show_vals else None,
+            textposition=("outside" if show_vals else None),
+            cliponaxis=False,
+        )
+    )
+    # Job B — com ranhuras (pattern)
+    fig.add_trace(
+        go.Bar(
+            name=nameB,
+            x=list(ch_order),
+            y=np.asarray(yB, dtype=float),
+            marker=dict(
+                color=list(colors),
+                pattern=dict(shape="/")  # <<< hachuras para diferenciar
+            ),
+            marker_line=dict(color="rgba(17,24,39,.8)", width=1.0),
+            text=[format(v, fmt) + suffix for v in yB] if show_vals else None,
+            textposition=("outside" if show_vals else None),
+            cliponaxis=False,
+        )
+    )
+    fig.update_layout(
+        template="plotly_white",
+        barmode="group",
+        height=height,
+        margin=dict(l=10, r=10, t=30, b=10),
+        yaxis_title=y_label,
+        xaxis_title="Channel",
+        legend_title=None,
+    )
+    return fig
 
-        pdf.savefig(fig, bbox_inches='tight'); plt.close(fig)
-    return buf.getvalue()
 # ===========================================
 # FLUXO: COMPARE A×B — Option B (forms + Apply + global calculate)
 # ===========================================
@@ -3121,7 +3695,9 @@ def ui_compare_option_b():
     # =========================
     def job_preview(prefix: str, label: str, zbytes: bytes, show_ml: bool = True, show_px: bool = True):
         """Show preview, per-channel consumption chart and Fire pixels — unit-aware."""
-        files, xmls, jpgs, tifs, ad = read_zip_listing(zbytes)
+        zkey = st.session_state.get(f"{prefix}_zip_key")
+        zidx = _zip_index(zbytes, cache_ns=prefix, zip_key=zkey)
+        xmls, jpgs, tifs = zidx["xmls"], zidx["jpgs"], zidx["tifs"]
         c1, c2, c3 = st.columns(3)
         c1.metric("XML files", len(xmls)); c2.metric("JPG files", len(jpgs)); c3.metric("TIFF files", len(tifs))
         # Silently ignore AppleDouble entries if present
@@ -3132,11 +3708,7 @@ def ui_compare_option_b():
         prev_h = int(st.session_state.get("cmp_prev_h", 460))
 
         # Mapa canal -> TIFF para este job
-        chan_map = {}
-        for p in tifs:
-            ch = get_channel_from_filename(p.split("/")[-1])
-            if ch:
-                chan_map[ch] = p
+        chan_map = zidx["chan_map"]
 
         selected_channel = st.session_state.get("cmp_chan_sel", "Preview")
 
@@ -3152,8 +3724,10 @@ def ui_compare_option_b():
             help="Used only for the per-channel chart below.",
             key=f"{prefix}_xml_legend",
         )
-        mlm2 = {}
-        mlm2 = ml_per_m2_from_xml_bytes(read_bytes_from_zip(zbytes, xml_for_legend, cache_ns=prefix))
+        # XML da legenda lido e hasheado uma vez; ml/m², dimensões e pixels reusam a mesma chave
+        xml_leg = read_bytes_from_zip(zbytes, xml_for_legend, cache_ns=prefix, zip_key=zkey)
+        xml_leg_h = _xml_hash(xml_leg)
+        mlm2 = ml_per_m2_from_xml_bytes(xml_leg, xml_leg_h)
         if not has_color_channels(mlm2):
             fb = pick_first_with_colors(zbytes, cache_ns=prefix)
             if fb:
@@ -3162,7 +3736,7 @@ def ui_compare_option_b():
         display_consumption = dict(mlm2 or {})
         if get_unit() != "m2":
             try:
-                w_xml_sel, _h_dummy, _a_dummy = get_xml_dims_m(read_bytes_from_zip(zbytes, xml_for_legend, cache_ns=prefix))
+                w_xml_sel, _h_dummy, _a_dummy = get_xml_dims_m(xml_leg, xml_leg_h)
             except Exception:
                 w_xml_sel = 0.0
             width_for_conversion = float(
@@ -3193,6 +3767,7 @@ def ui_compare_option_b():
                 trim_flag=trim_flag,
                 max_side=int(prev_w * 1.35),
                 caption=path or "Preview",
+                zip_key=zkey,
             )
             if selected_channel != "Preview" and display_consumption:
                 v = display_consumption.get(selected_channel)
@@ -3212,56 +3787,32 @@ def ui_compare_option_b():
             )
             if display_consumption:
                 items = sorted(display_consumption.items(), key=lambda kv: kv[1], reverse=True)
-                labels = [k for k, _ in items]
-                values = [v for _, v in items]
-                colors = [CHANNEL_COLORS.get(k, "#888") for k in labels]
-
-                fig_ch = go.Figure()
+                labels = tuple(k for k, _ in items)
+                values = tuple(float(v) for _, v in items)
+                colors = tuple(CHANNEL_COLORS.get(k, "#888") for k in labels)
                 _show_vals = bool(st.session_state.get("cmp_job_show_vals", False))
-                fig_ch.add_trace(go.Bar(
-                    x=labels, y=values, marker=dict(color=colors),
-                    text=[f"{v:.2f}" for v in values] if _show_vals else None,
-                    textposition="outside" if _show_vals else None,
-                    cliponaxis=False if _show_vals else None,
-                ))
-                fig_ch.update_layout(
-                    template="plotly_white",
-                    height=prev_h,
-                    margin=dict(l=10, r=10, t=30, b=10),
-                    yaxis_title=unit_consumption_label,
-                    xaxis_title="Channel",
-                )
+                fig_ch = _build_bar_fig(labels, values, colors, prev_h, unit_consumption_label, ".2f" if _show_vals else None)
                 st.plotly_chart(fig_ch, use_container_width=True, key=f"{prefix}_ml_chart", config=plotly_cfg())
             else:
                 st.info("Select an XML to display the chart.")
 
-        # --- Fire pixels per channel (K) ---
-        pxm2 = {}
-        try:
-            pxm2 = fire_pixels_map_from_xml_bytes(read_bytes_from_zip(zbytes, xml_for_legend, cache_ns=prefix))
-        except Exception:
-            pxm2 = {}
-
+        # --- Fire pixels per channel (K) — só lê o XML quando o gráfico está visível ---
         if show_px:
+            pxm2 = {}
+            try:
+                pxm2 = fire_pixels_map_from_xml_bytes(xml_leg, xml_leg_h)
+            except Exception:
+                pxm2 = {}
             render_title_with_hint(
                 "Fire pixels per channel (K)",
                 "K pixels fired per channel, read from NumberOfFirePixelsPerSeparation in the XML."
             )
             if pxm2:
                 items_px = sorted(pxm2.items(), key=lambda kv: kv[1], reverse=True)
-                labels_px = [k for k, _ in items_px]
-                values_px = [float(v)/1000.0 for _, v in items_px]  # K pixels
-                colors_px = [CHANNEL_COLORS.get(k, "#888") for k in labels_px]
-
-                fig_px = go.Figure()
-                fig_px.add_trace(go.Bar(x=labels_px, y=values_px, marker=dict(color=colors_px), text=[f"{v:.1f}" for v in values_px], textposition="outside", cliponaxis=False))
-                fig_px.update_layout(
-                    template="plotly_white",
-                    height=prev_h,
-                    margin=dict(l=10, r=10, t=30, b=10),
-                    yaxis_title="K pixels",
-                    xaxis_title="Channel",
-                )
+                labels_px = tuple(k for k, _ in items_px)
+                values_px = tuple(float(v)/1000.0 for _, v in items_px)  # K pixels
+                colors_px = tuple(CHANNEL_COLORS.get(k, "#888") for k in labels_px)
+                fig_px = _build_bar_fig(labels_px, values_px, colors_px, prev_h, "K pixels", ".1f")
                 st.plotly_chart(fig_px, use_container_width=True, key=f"{prefix}_px_chart", config=plotly_cfg())
             else:
                 st.info("This XML does not contain 'NumberOfFirePixelsPerSeparation'.")
@@ -3272,8 +3823,7 @@ def ui_compare_option_b():
         # Read original dims from the selected XML
         w0 = h0 = 0.0
         try:
-            xml_bytes_sz = read_bytes_from_zip(zbytes, xml_for_legend, cache_ns=prefix)
-            w0, h0, _ = get_xml_dims_m(xml_bytes_sz)
+            w0, h0, _ = get_xml_dims_m(xml_leg, xml_leg_h)
         except Exception:
             pass
 
@@ -3314,35 +3864,27 @@ def ui_compare_option_b():
 
         if mlm2:
             area = max(0.0, width_m * length_m) * (1.0 + float(waste or 0.0)/100.0)
-            rows_sz = []
-            total_ml = 0.0
-            total_linear_per_m = 0.0
-            total_linear_ml = 0.0
-            color_total = white_total = fof_total = 0.0
-            for ch_name, ml_per_m2 in sorted(mlm2.items(), key=lambda kv: kv[1], reverse=True):
-                ml_per_m2 = float(ml_per_m2)
-                ml_total = ml_per_m2 * area
-                linear_per_m = ml_per_m2 * float(width_m or 0.0)
-                linear_total = linear_per_m * float(length_m or 0.0)
-                rows_sz.append({
-                    "Channel": ch_name,
-                    "ml/m²": round(ml_per_m2, 3),
-                    "Area (m²)": round(area, 3),
-                    "Ink (ml)": round(ml_total, 2),
-                    "Linear (ml/m)": round(linear_per_m, 2),
-                    "Linear total (ml)": round(linear_total, 2),
-                })
-                total_ml += ml_total
-                total_linear_per_m += linear_per_m
-                total_linear_ml += linear_total
-                low = (ch_name or '').lower()
-                if low in CHANNELS_WHITE:
-                    white_total += ml_total
-                elif low in CHANNELS_FOF:
-                    fof_total += ml_total
-                else:
-                    color_total += ml_total
-            df_sz = pd.DataFrame(rows_sz)
+            # Colunas calculadas de uma vez (arrays na ordem já ordenada por ml/m²)
+            items_sz = sorted(mlm2.items(), key=lambda kv: kv[1], reverse=True)
+            n_sz = len(items_sz)
+            ml_arr = np.fromiter((float(v) for _, v in items_sz), dtype=float, count=n_sz)
+            cls_arr = np.fromiter((channel_class(k) for k, _ in items_sz), dtype=np.intp, count=n_sz)
+            ink_arr = ml_arr * area
+            lin_arr = ml_arr * float(width_m or 0.0)
+            lin_tot_arr = lin_arr * float(length_m or 0.0)
+            df_sz = pd.DataFrame({
+                "Channel": [k for k, _ in items_sz],
+                "ml/m²": ml_arr.round(3),
+                "Area (m²)": round(area, 3),
+                "Ink (ml)": ink_arr.round(2),
+                "Linear (ml/m)": lin_arr.round(2),
+                "Linear total (ml)": lin_tot_arr.round(2),
+            })
+            total_ml = float(ink_arr.sum())
+            total_linear_per_m = float(lin_arr.sum())
+            total_linear_ml = float(lin_tot_arr.sum())
+            # 0=color, 1=white, 2=fof (channel_class)
+            color_total, white_total, fof_total = np.bincount(cls_arr, weights=ink_arr, minlength=3)[:3].tolist()
             st.caption(f"Area (m²): {area:.3f}")
             cols_order = [c for c in ["Channel","ml/m²","Ink (ml)","Linear (ml/m)","Linear total (ml)"] if c in df_sz.columns]
             st.dataframe(
@@ -3361,7 +3903,7 @@ def ui_compare_option_b():
             l2.metric("Linear total (ml)", f"{total_linear_ml:,.2f}")
             # Export CSV
             try:
-                csv_data = pd.DataFrame(rows_sz).to_csv(index=False).encode('utf-8')
+                csv_data = df_sz.to_csv(index=False).encode('utf-8')
                 st.download_button("Download size table (CSV)", data=csv_data, file_name=f"{_slug(label.lower())}_size_table.csv", mime="text/csv", key=f"{prefix}_size_csv")
             except Exception:
                 pass
@@ -3374,7 +3916,13 @@ def ui_compare_option_b():
     with upA_col:
         upA = st.file_uploader("Job A (ZIP)", type="zip", key="cmp_up_zipA")
         if upA is not None:
-            st.session_state["cmpA_zip_bytes"] = upA.getvalue()
+            # Bytes + digest só são atualizados quando o arquivo enviado muda
+            fid = getattr(upA, "file_id", None)
+            if fid is None or st.session_state.get("cmpA_zip_file_id") != fid:
+                zb = upA.getvalue()
+                st.session_state["cmpA_zip_bytes"] = zb
+                st.session_state["cmpA_zip_key"] = _zip_digest(zb)
+                st.session_state["cmpA_zip_file_id"] = fid
             try:
                 st.session_state["cmpA_zip_name"] = upA.name
             except Exception:
@@ -3382,7 +3930,13 @@ def ui_compare_option_b():
     with upB_col:
         upB = st.file_uploader("Job B (ZIP)", type="zip", key="cmp_up_zipB")
         if upB is not None:
-            st.session_state["cmpB_zip_bytes"] = upB.getvalue()
+            # Bytes + digest só são atualizados quando o arquivo enviado muda
+            fid = getattr(upB, "file_id", None)
+            if fid is None or st.session_state.get("cmpB_zip_file_id") != fid:
+                zb = upB.getvalue()
+                st.session_state["cmpB_zip_bytes"] = zb
+                st.session_state["cmpB_zip_key"] = _zip_digest(zb)
+                st.session_state["cmpB_zip_file_id"] = fid
             try:
                 st.session_state["cmpB_zip_name"] = upB.name
             except Exception:
@@ -3408,20 +3962,10 @@ def ui_compare_option_b():
     prev_h = int(st.session_state.get("cmp_prev_h", 460))
 
     # Build availability from both ZIPs
-    filesA, xmlsA, jpgsA, tifsA, _ = read_zip_listing(zA)
-    filesB, xmlsB, jpgsB, tifsB, _ = read_zip_listing(zB)
-
-    chan_map_A = {}
-    for p in tifsA:
-        ch = get_channel_from_filename(p.split("/")[-1])
-        if ch: chan_map_A[ch] = p
-    chan_map_B = {}
-    for p in tifsB:
-        ch = get_channel_from_filename(p.split("/")[-1])
-        if ch: chan_map_B[ch] = p
-
-    has_prev_A = len([p for p in jpgsA if re.search(r"preview", p, re.I)]) > 0
-    has_prev_B = len([p for p in jpgsB if re.search(r"preview", p, re.I)]) > 0
+    idxA = _zip_index(zA, cache_ns="cmpA", zip_key=st.session_state.get("cmpA_zip_key"))
+    idxB = _zip_index(zB, cache_ns="cmpB", zip_key=st.session_state.get("cmpB_zip_key"))
+    chan_map_A, has_prev_A = idxA["chan_map"], idxA["has_preview"]
+    chan_map_B, has_prev_B = idxB["chan_map"], idxB["has_preview"]
 
     ordered_all = ["Preview","Cyan","Magenta","Yellow","Black","Red","Green","FOF","White"]
     union_available = []
@@ -3508,72 +4052,36 @@ def ui_compare_option_b():
             ch_order = sorted(ch_order, key=lambda c: deltas[c], reverse=True)
 
         # Series aligned to final order
-        yA_ord = [float(mlA_map.get(c, 0.0)) for c in ch_order]
-        yB_ord = [float(mlB_map.get(c, 0.0)) for c in ch_order]
+        # (arrays vão direto para o Plotly; as listas seguem para textos e PDF)
+        n_ch = len(ch_order)
+        yA_arr = np.fromiter((float(mlA_map.get(c, 0.0)) for c in ch_order), dtype=float, count=n_ch)
+        yB_arr = np.fromiter((float(mlB_map.get(c, 0.0)) for c in ch_order), dtype=float, count=n_ch)
         # Optional normalization by channel (%)
         if st.checkbox("Normalize by channel (%)", value=st.session_state.get("cmp_norm_by_channel", False), key="cmp_norm_by_channel"):
-            sums = [a+b for a,b in zip(yA_ord, yB_ord)]
-            yA_ord = [ (0.0 if s==0 else a/s*100.0) for a,s in zip(yA_ord, sums) ]
-            yB_ord = [ (0.0 if s==0 else b/s*100.0) for b,s in zip(yB_ord, sums) ]
+            sums = yA_arr + yB_arr
+            yA_arr = np.divide(yA_arr, sums, out=np.zeros(n_ch), where=sums != 0) * 100.0
+            yB_arr = np.divide(yB_arr, sums, out=np.zeros(n_ch), where=sums != 0) * 100.0
             y_label = "% of channel"
         else:
             y_label = "ml/m²"
+        yA_ord, yB_ord = yA_arr.tolist(), yB_arr.tolist()
         show_vals = st.checkbox("Show values on bars", value=st.session_state.get("cmp_show_values", False), key="cmp_show_values")
         bar_colors = [CHANNEL_COLORS.get(c, "#888") for c in ch_order]
         h_cmp = int(st.session_state.get("cmp_prev_h", 460))
 
-        fig_cmp = go.Figure()
         nameA = st.session_state.get("cmpA_zip_name", "Job A")
         nameB = st.session_state.get("cmpB_zip_name", "Job B")
-        # Job A — sólido
-        textA = [ (f"{v:.1f}%" if y_label.startswith('%') else f"{v:.2f}") for v in yA_ord ] if show_vals else None
-        fig_cmp.add_trace(
-            go.Bar(
-                name=nameA,
-                x=ch_order,
-                y=yA_ord,
-                marker=dict(color=bar_colors),
-                text=textA,
-                textposition=("outside" if show_vals else None),
-                cliponaxis=False,
-            )
-        )
-        # Job B — com ranhuras (pattern)
-        textB = [ (f"{v:.1f}%" if y_label.startswith('%') else f"{v:.2f}") for v in yB_ord ] if show_vals else None
-        fig_cmp.add_trace(
-            go.Bar(
-                name=nameB,
-                x=ch_order,
-                y=yB_ord,
-                marker=dict(
-                    color=bar_colors,
-                    pattern=dict(shape="/")  # <<< hachuras para diferenciar
-                ),
-                marker_line=dict(color="rgba(17,24,39,.8)", width=1.0),
-                text=textB,
-                textposition=("outside" if show_vals else None),
-                cliponaxis=False,
-            )
-        )
-        fig_cmp.update_layout(
-            template="plotly_white",
-            barmode="group",
-            height=h_cmp,
-            margin=dict(l=10, r=10, t=30, b=10),
-            yaxis_title=y_label,
-            xaxis_title="Channel",
-            legend_title=None,
-        )
         # Toggle for combined ml/m² chart
         if "cmp_combined_show_ml" not in st.session_state:
             st.session_state["cmp_combined_show_ml"] = True
         if st.session_state.get("cmp_combined_show_ml", True):
+            fig_cmp = _build_cmp_fig(tuple(ch_order), tuple(yA_ord), tuple(yB_ord), tuple(bar_colors),
+                                     bool(show_vals), y_label, h_cmp, nameA, nameB)
             st.plotly_chart(fig_cmp, use_container_width=True, key="cmp_combined_ml_chart", config=plotly_cfg())
 
         # Heatmap option for compact comparison
         if st.checkbox("Show per-channel heatmap", value=st.session_state.get("cmp_show_heatmap", False), key="cmp_show_heatmap"):
-            import numpy as np
-            z = np.array([yA_ord, yB_ord])
+            z = np.vstack((yA_arr, yB_arr))
             fig_h = go.Figure(data=go.Heatmap(z=z, x=ch_order, y=[nameA, nameB], colorscale='Blues', colorbar=dict(title=y_label)))
             fig_h.update_layout(template='plotly_white', height=h_cmp, margin=dict(l=10,r=10,t=30,b=10), xaxis_title='Channel', yaxis_title='File')
             st.plotly_chart(fig_h, use_container_width=True, key="cmp_heatmap_chart", config=plotly_cfg())
@@ -3603,22 +4111,37 @@ def ui_compare_option_b():
         show_comp = cpdf2.checkbox("Show 100% composition", key="cmp_pdf_show_comp")
         show_totals = cpdf3.checkbox("Totals below previews", key="cmp_pdf_show_totals")
 
-        try:
-            nameA = st.session_state.get("cmpA_zip_name", "Job A")
-            nameB = st.session_state.get("cmpB_zip_name", "Job B")
-            with st.spinner("Building A×B PDF…"):
-                pdf_bytes = build_comparison_pdf_matplotlib(
-                    ch_order, yA_ord, yB_ord, mlA_map, mlB_map,
-                    labelA=nameA, labelB=nameB,
-                    zA_bytes=zA, zB_bytes=zB,
-                    selected_channel=st.session_state.get("cmp_chan_sel", "Preview"),
-                    show_comp=show_comp,
-                    preview_size={"Small":"S","Medium":"M","Large":"L"}[size_opt],
-                    show_totals=show_totals,
-                )
-            st.download_button("A×B PDF", data=pdf_bytes, file_name="compare_AxB.pdf", mime="application/pdf")
-        except Exception as e:
-            st.info(f"PDF not available: {e}")
+        # PDF só é gerado no clique; os bytes ficam na sessão junto com a assinatura das entradas
+        nameA = st.session_state.get("cmpA_zip_name", "Job A")
+        nameB = st.session_state.get("cmpB_zip_name", "Job B")
+        sel_ch = st.session_state.get("cmp_chan_sel", "Preview")
+        pdf_sig = (
+            tuple(ch_order), tuple(yA_ord), tuple(yB_ord),
+            tuple(sorted(mlA_map.items())), tuple(sorted(mlB_map.items())),
+            nameA, nameB, st.session_state.get("cmpA_zip_key"), st.session_state.get("cmpB_zip_key"),
+            sel_ch, size_opt, bool(show_comp), bool(show_totals), get_unit(),
+        )
+        if st.button("Build A×B PDF", key="cmp_pdf_go"):
+            try:
+                with st.spinner("Building A×B PDF…"):
+                    st.session_state["cmp_pdf_bytes"] = build_comparison_pdf_matplotlib(
+                        ch_order, yA_ord, yB_ord, mlA_map, mlB_map,
+                        labelA=nameA, labelB=nameB,
+                        zA_bytes=zA, zB_bytes=zB,
+                        selected_channel=sel_ch,
+                        show_comp=show_comp,
+                        preview_size={"Small":"S","Medium":"M","Large":"L"}[size_opt],
+                        show_totals=show_totals,
+                    )
+                st.session_state["cmp_pdf_sig"] = pdf_sig
+            except Exception as e:
+                st.session_state.pop("cmp_pdf_bytes", None)
+                st.session_state.pop("cmp_pdf_sig", None)
+                st.info(f"PDF not available: {e}")
+        if st.session_state.get("cmp_pdf_bytes"):
+            st.download_button("A×B PDF", data=st.session_state["cmp_pdf_bytes"], file_name="compare_AxB.pdf", mime="application/pdf")
+            if st.session_state.get("cmp_pdf_sig") != pdf_sig:
+                st.caption("Inputs changed since this PDF was built — click **Build A×B PDF** to refresh it.")
 
         # === Inputs A e B — agora realmente logo abaixo do botão A×B PDF ===
         st.markdown("---")
@@ -3640,35 +4163,35 @@ def ui_compare_option_b():
     cc1.number_input(
         "Color ink ($/L)",
         min_value=0.0,
-        value=float(st.session_state.get("cmp_ink_c", DEFAULTS["ink_color_per_l"])),
+        value=float(st.session_state.get("cmp_ink_c", DEFAULTS.ink_color_per_l)),
         step=1.0,
         key="cmp_ink_c",
     )
     cc2.number_input(
         "White ink ($/L)",
         min_value=0.0,
-        value=float(st.session_state.get("cmp_ink_w", DEFAULTS["ink_white_per_l"])),
+        value=float(st.session_state.get("cmp_ink_w", DEFAULTS.ink_white_per_l)),
         step=1.0,
         key="cmp_ink_w",
     )
     cc3.number_input(
         "FOF / Pretreat ($/L)",
         min_value=0.0,
-        value=float(st.session_state.get("cmp_fof", DEFAULTS["fof_per_l"])),
+        value=float(st.session_state.get("cmp_fof", DEFAULTS.fof_per_l)),
         step=1.0,
         key="cmp_fof",
     )
     cc4.number_input(
         f"Substrate ({per_unit(UNIT)})",
         min_value=0.0,
-        value=float(st.session_state.get("cmp_fabric", DEFAULTS["fabric_per_unit"])),
+        value=float(st.session_state.get("cmp_fabric", DEFAULTS.fabric_per_unit)),
         step=0.10,
         key="cmp_fabric",
     )
 
     cur1, cur2, cur3 = st.columns(3)
-    local_symbol  = cur1.text_input("Local currency symbol", value=st.session_state.get("single_local_sym", DEFAULTS["local_symbol"]), key="single_local_sym")
-    usd_to_local  = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("single_fx", DEFAULTS["usd_to_local"])), step=0.01, key="single_fx")
+    local_symbol  = cur1.text_input("Local currency symbol", value=st.session_state.get("single_local_sym", DEFAULTS.local_symbol), key="single_local_sym")
+    usd_to_local  = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("single_fx", DEFAULTS.usd_to_local)), step=0.01, key="single_fx")
     currency_out  = cur3.radio("Output currency", ["USD", "Local"], index=1 if st.session_state.get("cmp_curr_out", "Local")=="Local" else 0, horizontal=True, key="cmp_curr_out")
     FX, SYM       = (1.0, "US$") if currency_out=="USD" else (usd_to_local, local_symbol)
 
@@ -3697,17 +4220,19 @@ def ui_compare_option_b():
         k_terms   = f"{prefix}_terms"
         k_round   = f"{prefix}_round"
 
+        snap = _cmp_job_snapshot(prefix)
+
         # Compartilhados do Compare
-        ink_c = float(st.session_state.get("cmp_ink_c",  DEFAULTS["ink_color_per_l"]))
-        ink_w = float(st.session_state.get("cmp_ink_w",  DEFAULTS["ink_white_per_l"]))
-        fof   = float(st.session_state.get("cmp_fof",    DEFAULTS["fof_per_l"]))
-        media = float(st.session_state.get("cmp_fabric", DEFAULTS["fabric_per_unit"]))
+        ink_c = float(snap["cmp_ink_c"])
+        ink_w = float(snap["cmp_ink_w"])
+        fof   = float(snap["cmp_fof"])
+        media = float(snap["cmp_fabric"])
 
         # Tabela de outros variáveis (por job) + mão de obra variável/h
-        other_vars_df = ensure_df(st.session_state.get(f"{prefix}_other_vars", [{"Name":"—","Value":0.0}]), ["Name","Value"])
+        other_vars_raw = snap[f"{prefix}_other_vars"]
 
         # XML do ZIP
-        xml_inner_path = st.session_state.get(k_xml)
+        xml_inner_path = snap[k_xml]
         if not xml_inner_path:
             _, xmls, *_ = read_zip_listing(uploaded_zip_bytes, cache_ns=prefix)
             xml_inner_path = xmls[0] if xmls else None
@@ -3715,6 +4240,7 @@ def ui_compare_option_b():
             st.session_state[f"{prefix}_panels"] = {"error": "No XML in ZIP."}
             return
         xml_bytes = read_bytes_from_zip(uploaded_zip_bytes, xml_inner_path, cache_ns=prefix)
+        xml_hash = _xml_hash(xml_bytes)
 
         # Fatores (reaproveita os do Single)
         factors = {
@@ -3724,60 +4250,55 @@ def ui_compare_option_b():
         }
 
         # Mapa de consumo
-        mlmap_use = apply_consumption_source(
-            xml_bytes,
-            st.session_state.get(k_cons, "XML (exact)"),
-            st.session_state.get(k_mode),
-            factors,
-            st.session_state.get(k_man_c, 0.0),
-            st.session_state.get(k_man_w, 0.0),
-            st.session_state.get(k_man_f, 0.0),
-        )
-
-        # >>> Fallback: se a fonte selecionada for XML e o mapa tiver só White/FOF,
-        # usa o primeiro XML do ZIP que contenha canais de cor (e aplica multiplicadores se for o modo “XML + mode …”)
-        if str(st.session_state.get(k_cons, "XML (exact)")).startswith("XML") and not has_color_channels(mlmap_use):
-            fb = pick_first_with_colors(uploaded_zip_bytes, cache_ns=prefix)
-            if fb:
-                if str(st.session_state.get(k_cons)).startswith("XML + mode"):
-                    group_key = MODE_GROUP.get(st.session_state.get(k_mode), "").lower()
-                    mlmap_use = apply_mode_factors(fb, group_key, factors)
-                else:
+        src_kind = cons_source_kind(snap[k_cons])
+        if src_kind is ConsSource.MANUAL:
+            mlmap_use = apply_consumption_source(
+                xml_bytes, snap[k_cons], snap[k_mode], factors,
+                snap[k_man_c], snap[k_man_w], snap[k_man_f],
+            )
+        else:
+            # Mapa cru do XML; o multiplicador de modo é aplicado uma única vez, depois do fallback
+            mlmap_use = ml_per_m2_from_xml_bytes(xml_bytes, xml_hash)
+            # >>> Fallback: se a fonte selecionada for XML e o mapa tiver só White/FOF,
+            # usa o primeiro XML do ZIP que contenha canais de cor (e aplica multiplicadores se for o modo “XML + mode …”)
+            if not has_color_channels(mlmap_use):
+                fb = pick_first_with_colors(uploaded_zip_bytes, cache_ns=prefix)
+                if fb:
                     mlmap_use = fb
+            if src_kind is ConsSource.XML_MODE:
+                mlmap_use = apply_mode_factors(mlmap_use, MODE_GROUP.get(snap[k_mode], "standard"), factors)
         # <<< fim do fallback
 
-        width_m  = float(st.session_state.get(k_width,  1.0))
-        length_m = float(st.session_state.get(k_length, 1.0))
-        waste    = float(st.session_state.get(k_waste,  0.0))
+        width_m  = float(snap[k_width])
+        length_m = float(snap[k_length])
+        waste    = float(snap[k_waste])
         # Resolve speed from a robust mode key
-        _mode_key = st.session_state.get(k_mode)
-        if _mode_key not in PRINT_MODES:
-            _mode_key = infer_mode_from_xml(xml_bytes) if infer_mode_from_xml(xml_bytes) in PRINT_MODES else (list(PRINT_MODES.keys())[0] if PRINT_MODES else None)
-        speed    = PRINT_MODES.get(_mode_key, {}).get("speed", 0.0)
+        _mode_key = resolve_mode_key(snap[k_mode], xml_bytes, xml_hash)
+        speed    = _MODE_SPEED.get(_mode_key, 0.0)
 
         # Mão de obra variável -> por unidade
-        labor_h = float(st.session_state.get(f"{prefix}_lab_h", 0.0))
+        labor_h = float(snap[f"{prefix}_lab_h"])
         if UNIT == "m2":
             labor_var_per_unit = labor_h / max(1e-9, speed)
         else:
             m_per_h = speed / max(1e-9, width_m)
             labor_var_per_unit = labor_h / max(1e-9, m_per_h)
 
-        other_vars_sum = float(other_vars_df["Value"].fillna(0).sum()) + labor_var_per_unit
+        other_vars_sum = _sum_value_column(other_vars_raw) + labor_var_per_unit
 
         # --- Fixed allocation per job: resolve direct vs monthly helper ---
-        fix_mode_val = (st.session_state.get(f"{prefix}_fix_mode") or "Direct per unit")
+        fix_mode_val = (snap[f"{prefix}_fix_mode"] or "Direct per unit")
         if str(fix_mode_val).lower().startswith("monthly"):
-            fix_labor_m   = float(st.session_state.get(f"{prefix}_fix_labor_month", 0.0))
-            fix_leasing_m = float(st.session_state.get(f"{prefix}_fix_leasing_month", 0.0))
-            fix_depr_m    = float(st.session_state.get(f"{prefix}_fix_depr_month", 0.0))
-            fix_over_m    = float(st.session_state.get(f"{prefix}_fix_over_month", 0.0))
-            fix_others_df = ensure_df(st.session_state.get(f"{prefix}_fix_others", [{"Name":"—","Value":0.0}]), ["Name","Value"])
-            fix_others_m  = float(fix_others_df["Value"].fillna(0).sum())
-            prod_month_u  = float(st.session_state.get(f"{prefix}_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30000.0)))
-            fixed_per_unit_used = (fix_labor_m + fix_leasing_m + fix_depr_m + fix_over_m + fix_others_m) / prod_month_u if prod_month_u > 0 else 0.0
+            fix_labor_m   = float(snap[f"{prefix}_fix_labor_month"])
+            fix_leasing_m = float(snap[f"{prefix}_fix_leasing_month"])
+            fix_depr_m    = float(snap[f"{prefix}_fix_depr_month"])
+            fix_over_m    = float(snap[f"{prefix}_fix_over_month"])
+            fix_others_m  = _sum_value_column(snap[f"{prefix}_fix_others"])
+            prod_month_u  = float(snap[f"{prefix}_fix_prod_month_units"])
+            fix_month_tot = math.fsum((fix_labor_m, fix_leasing_m, fix_depr_m, fix_over_m, fix_others_m))
+            fixed_per_unit_used = fix_month_tot / prod_month_u if prod_month_u > 0 else 0.0
         else:
-            fixed_per_unit_used = float(st.session_state.get(k_fixed, 0.0))
+            fixed_per_unit_used = float(snap[k_fixed])
 
         res = simulate(
             UNIT,
@@ -3804,14 +4325,13 @@ def ui_compare_option_b():
         cost_unit_calc = total_cost / qty
 
         # Precificação
-        margin = float(st.session_state.get(k_margin, 20.0))
-        tax    = float(st.session_state.get(k_tax,    10.0))
-        terms  = float(st.session_state.get(k_terms,   2.1))
-        rnd    = float(st.session_state.get(k_round,  0.05))
-
-        price_input = float(st.session_state.get(k_price, 0.0))
-        suggested   = price_round(cost_unit_calc*(1 + margin/100 + tax/100), rnd)
-        suggested   = price_round(suggested*(1 + terms/100), rnd)
+        margin = float(snap[k_margin])
+        tax    = float(snap[k_tax])
+        terms  = float(snap[k_terms])
+        rnd    = float(snap[k_round])
+
+        price_input = float(snap[k_price])
+        suggested   = _suggest_price(cost_unit_calc, margin, tax, terms, rnd)
         effective_price = price_input if price_input>0 else suggested
 
         rows_tot, rows_unit = build_cost_rows_from_sim(res, unit_lbl, sym, fx, price=effective_price)
@@ -3904,7 +4424,7 @@ def ui_compare_option_b():
                         # Sum of the monthly fixed inputs from the helper
                         sum_others = 0.0
                         if st.session_state.get(f"{pref}_fix_others"):
-                            sum_others = ensure_df(st.session_state.get(f"{pref}_fix_others", []), ["Name","Value"])["Value"].fillna(0).sum()
+                            sum_others = _sum_value_column(st.session_state.get(f"{pref}_fix_others"))
                         fixed_month = (
                             float(st.session_state.get(f"{pref}_fix_labor_month", 0.0))
                             + float(st.session_state.get(f"{pref}_fix_leasing_month", 0.0))
@@ -3997,8 +4517,6 @@ def ml_table_column_config():
         return {}
 
 # --- Insights helper for A×B per-channel comparison ---
-from typing import List
-
 def insights_for_compare_maps(mlA: dict, mlB: dict) -> List[str]:
     """Return short, high-signal insights comparing per-channel ml/m² between A and B."""
     tips: List[str] = []
@@ -4130,7 +4648,7 @@ def total_ml_per_m2_from_map(ml_map: dict) -> float:
 def choose_path(channel, jpgs, chan_map):
     if channel == "Preview":
         if jpgs:
-            cand = [p for p in jpgs if re.search(r"preview", p, re.I)]
+            cand = [p for p in jpgs if _PREVIEW_RE.search(p)]
             return (cand[0] if cand else jpgs[0]), "jpg"
         if chan_map:
             first_path = next(iter(chan_map.values()))
@@ -4225,15 +4743,13 @@ def get_unit() -> str:
     val = str(st.session_state.get("global_unit", "m2")).lower()
     return "m2" if val in {"m2", "m²", "square"} else "m"
 
-def apply_consumption_source(xml_bytes, cons_src, mode_key, factors_dict, man_c=0.0, man_w=0.0, man_f=0.0):
-    mlmap_xml = ml_per_m2_from_xml_bytes(xml_bytes)
-    opt = (cons_src or "").strip().lower()
-
-    if opt in {"xml (exact)", "xml (exato)"}:
-        return mlmap_xml
-    elif opt.startswith("xml + mode multiplier") or opt.startswith("xml + multiplicador de modo"):
+def apply_consumption_source(xml_bytes, cons_src, mode_key, factors_dict, man_c=0.0, man_w=0.0, man_f=0.0, xml_hash=None):
+    kind = cons_source_kind(cons_src)
+    if kind is ConsSource.XML:
+        return ml_per_m2_from_xml_bytes(xml_bytes, xml_hash)
+    elif kind is ConsSource.XML_MODE:
         grp = MODE_GROUP.get(mode_key, "standard")
-        return apply_mode_factors(mlmap_xml, grp, factors_dict)
+        return apply_mode_factors(ml_per_m2_from_xml_bytes(xml_bytes, xml_hash), grp, factors_dict)
     else:
         out = {}
         if man_c > 0: out["Color"] = man_c
@@ -4403,7 +4919,13 @@ def ui_single():
     # ---------- Uploader ----------
     up = st.file_uploader("Job (ZIP)", type="zip", key="single_up_zip")
     if up is not None:
-        st.session_state["single_zip_bytes"] = up.getvalue()
+        # Bytes + digest só mudam quando o arquivo enviado muda (não a cada rerun)
+        fid = getattr(up, "file_id", None)
+        if fid is None or st.session_state.get("single_zip_file_id") != fid:
+            zb = up.getvalue()
+            st.session_state["single_zip_bytes"] = zb
+            st.session_state["single_zip_key"] = _zip_digest(zb)
+            st.session_state["single_zip_file_id"] = fid
         try:
             st.session_state["single_zip_name"] = up.name
         except Exception:
@@ -4412,9 +4934,10 @@ def ui_single():
     if not z:
         st.info("Upload the Job ZIP to continue.")
         return
+    zkey = st.session_state.get("single_zip_key")
 
     # ---------- Basic listing + counters ----------
-    files, xmls, jpgs, tifs, ad = read_zip_listing(z)
+    files, xmls, jpgs, tifs, ad = read_zip_listing(z, zip_key=zkey)
     c1, c2, c3 = st.columns(3)
     c1.metric("XML files", len(xmls)); c2.metric("JPG files", len(jpgs)); c3.metric("TIFF files", len(tifs))
     # Silently ignore AppleDouble entries if present
@@ -4430,7 +4953,7 @@ def ui_single():
         if ch:
             chan_map[ch] = p
 
-    has_prev = any(re.search(r"preview", p, re.I) for p in jpgs)
+    has_prev = any(_PREVIEW_RE.search(p) for p in jpgs)
     ordered_all = ["Preview","Cyan","Magenta","Yellow","Black","Red","Green","FOF","White"]
     available = []
     for c in ordered_all:
@@ -4468,7 +4991,7 @@ def ui_single():
             key=prefix_key,
         )
         try:
-            mlm2 = ml_per_m2_from_xml_bytes(read_bytes_from_zip(z, xml_for_legend, cache_ns="single"))
+            mlm2 = ml_per_m2_from_xml_bytes(read_bytes_from_zip(z, xml_for_legend, cache_ns="single", zip_key=zkey))
         except Exception:
             mlm2 = {}
         return xml_for_legend, mlm2
@@ -4493,6 +5016,7 @@ def ui_single():
                 trim_flag=trim_flag,
                 max_side=int(prev_w * 1.35),
                 caption=path,
+                zip_key=zkey,
             )
             sel = st.session_state.get("single_chan_sel")
             if sel != "Preview" and mlm2:
@@ -4540,7 +5064,7 @@ def ui_single():
             "K pixels fired per channel, from NumberOfFirePixelsPerSeparation in the XML."
         )
         try:
-            pxm2 = fire_pixels_map_from_xml_bytes(read_bytes_from_zip(z, xml_for_legend, cache_ns="single"))
+            pxm2 = fire_pixels_map_from_xml_bytes(read_bytes_from_zip(z, xml_for_legend, cache_ns="single", zip_key=zkey))
         except Exception:
             pxm2 = {}
         if pxm2:
@@ -4562,7 +5086,7 @@ def ui_single():
     # Get XML original dimensions
     w0 = h0 = 0.0
     try:
-        xml_bytes_sz = read_bytes_from_zip(z, xml_for_legend, cache_ns="single")
+        xml_bytes_sz = read_bytes_from_zip(z, xml_for_legend, cache_ns="single", zip_key=zkey)
         w0, h0, _ = get_xml_dims_m(xml_bytes_sz)
     except Exception:
         pass
@@ -4626,10 +5150,10 @@ def ui_single():
             total_ml += ml_total
             total_linear_per_m += linear_per_m
             total_linear_ml += linear_total
-            low = (ch_name or '').lower()
-            if low in CHANNELS_WHITE:
+            cls = channel_class(ch_name)
+            if cls == 1:
                 white_total += ml_total
-            elif low in CHANNELS_FOF:
+            elif cls == 2:
                 fof_total += ml_total
             else:
                 color_total += ml_total
@@ -4699,7 +5223,7 @@ def ui_single():
 
     # ---------- Job — Inputs (Apply), placed right below charts ----------
     def job_inputs_single(prefix: str, label: str):
-        files_, xmls_, jpgs_, tifs_, _ = read_zip_listing(z, cache_ns="single")
+        files_, xmls_, jpgs_, tifs_, _ = read_zip_listing(z, cache_ns="single", zip_key=zkey)
         with form_or_live(
             f"{prefix}_inputs",
             "Apply Job",
@@ -4708,7 +5232,7 @@ def ui_single():
         ) as do_compute:
             xml_default = 0 if not st.session_state.get(f"{prefix}_xml_sel") else max(0, min(len(xmls_)-1, xmls_.index(st.session_state.get(f"{prefix}_xml_sel")))) if st.session_state.get(f"{prefix}_xml_sel") in xmls_ else 0
             xml_sel = st.selectbox("XML (ml/m² base)", options=xmls_, index=xml_default, key=f"{prefix}_xml_sel")
-            xml_bytes_hdr = read_bytes_from_zip(z, st.session_state.get(f"{prefix}_xml_sel", xml_sel), cache_ns="single")
+            xml_bytes_hdr = read_bytes_from_zip(z, st.session_state.get(f"{prefix}_xml_sel", xml_sel), cache_ns="single", zip_key=zkey)
             w_xml_def, h_xml_def, area_xml_m2_def = get_xml_dims_m(xml_bytes_hdr)
     
             auto_mode = infer_mode_from_xml(xml_bytes_hdr)
@@ -4821,7 +5345,7 @@ def ui_single():
 
                 prod_m = monthly_production_inputs(get_unit(), unit_label_short(get_unit()), state_prefix=f"{prefix}_fix")
 
-                sum_others = ensure_df(st.session_state.get(f"{prefix}_fix_others", []), ["Name","Value"]).get("Value", pd.Series(dtype=float)).fillna(0).sum() if st.session_state.get(f"{prefix}_fix_others") else 0.0
+                sum_others = _sum_value_column(st.session_state.get(f"{prefix}_fix_others"))
                 total_fix_m = (
                     float(st.session_state.get(f"{prefix}_fix_labor_month", 0.0))
                     + float(st.session_state.get(f"{prefix}_fix_leasing_month", 0.0))
@@ -4840,7 +5364,7 @@ def ui_single():
                 pv5.number_input("Fees/Terms (%)", min_value=0.0, value=float(st.session_state.get(f"{prefix}_terms", 2.10)), step=0.05, key=f"{prefix}_terms")
                 st.selectbox("Round to", ["0.01", "0.05", "0.10"], index={"0.01":0,"0.05":1,"0.10":2}.get(str(st.session_state.get(f"{prefix}_round", 0.05)),1), key=f"{prefix}_round", help="Rounding step for suggested price.")
         if do_compute:
-            if str(st.session_state.get(f"{prefix}_cons_source", "")).startswith("XML + mode"):
+            if cons_source_kind(st.session_state.get(f"{prefix}_cons_source")) is ConsSource.XML_MODE:
                 sync_mode_scalers_from_prefix(prefix)
             st.success(f"{label} saved. Now click 'Calculate'.")
         else:
@@ -4853,14 +5377,14 @@ def ui_single():
     # ---------- Shared costs & currency (Single) ----------
     section("Costs & currency", "Applies to the job.")
     cc1, cc2, cc3, cc4 = st.columns(4)
-    cc1.number_input("Color ink ($/L)",  min_value=0.0, value=float(st.session_state.get("single_ink_c", DEFAULTS["ink_color_per_l"])),  step=1.0, key="single_ink_c")
-    cc2.number_input("White ink ($/L)",  min_value=0.0, value=float(st.session_state.get("single_ink_w", DEFAULTS["ink_white_per_l"])),  step=1.0, key="single_ink_w")
-    cc3.number_input("FOF / Pretreat ($/L)", min_value=0.0, value=float(st.session_state.get("single_fof", DEFAULTS["fof_per_l"])), step=1.0, key="single_fof")
-    cc4.number_input(f"Substrate ({per_unit(UNIT)})", min_value=0.0, value=float(st.session_state.get("single_fabric", DEFAULTS["fabric_per_unit"])), step=0.10, key="single_fabric")
+    cc1.number_input("Color ink ($/L)",  min_value=0.0, value=float(st.session_state.get("single_ink_c", DEFAULTS.ink_color_per_l)),  step=1.0, key="single_ink_c")
+    cc2.number_input("White ink ($/L)",  min_value=0.0, value=float(st.session_state.get("single_ink_w", DEFAULTS.ink_white_per_l)),  step=1.0, key="single_ink_w")
+    cc3.number_input("FOF / Pretreat ($/L)", min_value=0.0, value=float(st.session_state.get("single_fof", DEFAULTS.fof_per_l)), step=1.0, key="single_fof")
+    cc4.number_input(f"Substrate ({per_unit(UNIT)})", min_value=0.0, value=float(st.session_state.get("single_fabric", DEFAULTS.fabric_per_unit)), step=0.10, key="single_fabric")
 
     cur1, cur2, cur3 = st.columns(3)
-    local_symbol  = cur1.text_input("Local currency symbol", value=st.session_state.get("single_local_sym", DEFAULTS["local_symbol"]), key="single_local_sym")
-    usd_to_local  = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("single_fx", DEFAULTS["usd_to_local"])), step=0.01, key="single_fx")
+    local_symbol  = cur1.text_input("Local currency symbol", value=st.session_state.get("single_local_sym", DEFAULTS.local_symbol), key="single_local_sym")
+    usd_to_local  = cur2.number_input("USD → Local (FX)", min_value=0.0, value=float(st.session_state.get("single_fx", DEFAULTS.usd_to_local)), step=0.01, key="single_fx")
     currency_out  = cur3.radio("Output currency", ["USD", "Local"], index=1 if st.session_state.get("single_curr_out", "Local")=="Local" else 0, horizontal=True, key="single_curr_out")
     # Help glossary for costs
     render_help_glossary()
@@ -4871,21 +5395,21 @@ def ui_single():
         prefix = "single"
         UNIT_l = get_unit()
         # prices shared
-        ink_c = float(st.session_state.get("single_ink_c", DEFAULTS["ink_color_per_l"]))
-        ink_w = float(st.session_state.get("single_ink_w", DEFAULTS["ink_white_per_l"]))
-        fof   = float(st.session_state.get("single_fof",   DEFAULTS["fof_per_l"]))
-        media = float(st.session_state.get("single_fabric", DEFAULTS["fabric_per_unit"]))
+        ink_c = float(st.session_state.get("single_ink_c", DEFAULTS.ink_color_per_l))
+        ink_w = float(st.session_state.get("single_ink_w", DEFAULTS.ink_white_per_l))
+        fof   = float(st.session_state.get("single_fof",   DEFAULTS.fof_per_l))
+        media = float(st.session_state.get("single_fabric", DEFAULTS.fabric_per_unit))
 
-        other_vars_df = ensure_df(st.session_state.get(f"{prefix}_other_vars", [{"Name":"—","Value":0.0}]), ["Name","Value"])
+        other_vars_raw = st.session_state.get(f"{prefix}_other_vars")
 
         xml_inner_path = st.session_state.get(f"{prefix}_xml_sel")
         if not xml_inner_path:
-            _, xmls_i, *_ = read_zip_listing(z, cache_ns="single")
+            _, xmls_i, *_ = read_zip_listing(z, cache_ns="single", zip_key=zkey)
             xml_inner_path = xmls_i[0] if xmls_i else None
         if not xml_inner_path:
             st.session_state["single_panels"] = {"error": "No XML in ZIP."}
             return
-        xml_bytes = read_bytes_from_zip(z, xml_inner_path, cache_ns="single")
+        xml_bytes = read_bytes_from_zip(z, xml_inner_path, cache_ns="single", zip_key=zkey)
 
         factors = get_mode_factors_from_state()
 
@@ -4903,12 +5427,8 @@ def ui_single():
         length_m = float(st.session_state.get(f"{prefix}_length_m", 1.0))
         waste    = float(st.session_state.get(f"{prefix}_waste",    0.0))
         # Safe speed resolution from selected/auto/default mode
-        _mode_key = st.session_state.get(f"{prefix}_mode_sel")
-        if _mode_key not in PRINT_MODES:
-            # try to infer from current XML, else pick the first available
-            inferred = infer_mode_from_xml(xml_bytes)
-            _mode_key = inferred if inferred in PRINT_MODES else (list(PRINT_MODES.keys())[0] if PRINT_MODES else None)
-        speed = PRINT_MODES.get(_mode_key, {}).get("speed", 0.0)
+        _mode_key = resolve_mode_key(st.session_state.get(f"{prefix}_mode_sel"), xml_bytes)
+        speed    = _MODE_SPEED.get(_mode_key, 0.0)
 
         labor_h = float(st.session_state.get(f"{prefix}_lab_h", 0.0))
         if UNIT_l == "m2":
@@ -4917,7 +5437,7 @@ def ui_single():
             m_per_h = speed / max(1e-9, width_m)
             labor_var_per_unit = labor_h / max(1e-9, m_per_h)
 
-        other_vars_sum = float(other_vars_df["Value"].fillna(0).sum()) + labor_var_per_unit
+        other_vars_sum = _sum_value_column(other_vars_raw) + labor_var_per_unit
 
         fix_mode_val = (st.session_state.get(f"{prefix}_fix_mode") or "Direct per unit")
         if str(fix_mode_val).lower().startswith("monthly"):
@@ -4925,10 +5445,10 @@ def ui_single():
             fix_leasing_m = float(st.session_state.get(f"{prefix}_fix_leasing_month", 0.0))
             fix_depr_m    = float(st.session_state.get(f"{prefix}_fix_depr_month", 0.0))
             fix_over_m    = float(st.session_state.get(f"{prefix}_fix_over_month", 0.0))
-            fix_others_df = ensure_df(st.session_state.get(f"{prefix}_fix_others", [{"Name":"—","Value":0.0}]), ["Name","Value"])
-            fix_others_m  = float(fix_others_df["Value"].fillna(0).sum())
-            prod_month_u  = float(st.session_state.get(f"{prefix}_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30000.0)))
-            fixed_per_unit_used = (fix_labor_m + fix_leasing_m + fix_depr_m + fix_over_m + fix_others_m) / prod_month_u if prod_month_u > 0 else 0.0
+            fix_others_m  = _sum_value_column(st.session_state.get(f"{prefix}_fix_others"))
+            prod_month_u  = float(st.session_state.get(f"{prefix}_fix_prod_month_units", DEFAULTS.prod_month_units))
+            fix_month_tot = math.fsum((fix_labor_m, fix_leasing_m, fix_depr_m, fix_over_m, fix_others_m))
+            fixed_per_unit_used = fix_month_tot / prod_month_u if prod_month_u > 0 else 0.0
         else:
             fixed_per_unit_used = float(st.session_state.get(f"{prefix}_fixed_unit", 0.0))
 
@@ -4955,8 +5475,7 @@ def ui_single():
         terms  = float(st.session_state.get(f"{prefix}_terms",   2.1))
         rnd    = float(st.session_state.get(f"{prefix}_round",  0.05))
         price_input = float(st.session_state.get(f"{prefix}_price", 0.0))
-        suggested   = price_round(cost_unit_calc*(1 + margin/100 + tax/100), rnd)
-        suggested   = price_round(suggested*(1 + terms/100), rnd)
+        suggested   = _suggest_price(cost_unit_calc, margin, tax, terms, rnd)
         effective_price = price_input if price_input>0 else suggested
 
         rows_tot, rows_unit = build_cost_rows_from_sim(res, unit_lbl, sym, fx, price=effective_price)
@@ -5022,8 +5541,8 @@ def ui_single():
             if currency_out == "USD":
                 FX, SYM = 1.0, "US$"
             else:
-                FX  = float(st.session_state.get("single_fx", DEFAULTS.get("usd_to_local", 5.57)))
-                SYM = st.session_state.get("single_local_sym", DEFAULTS.get("local_symbol", "R$"))
+                FX  = float(st.session_state.get("single_fx", DEFAULTS.usd_to_local))
+                SYM = st.session_state.get("single_local_sym", DEFAULTS.local_symbol)
 
             UNIT = get_unit()
             unit_lbl = unit_label_short(UNIT)
@@ -5032,10 +5551,7 @@ def ui_single():
             if str(st.session_state.get("single_fix_mode", "")).lower().startswith("monthly"):
                 sum_others = 0.0
                 if st.session_state.get("single_fix_others"):
-                    sum_others = ensure_df(
-                        st.session_state.get("single_fix_others", []),
-                        ["Name", "Value"]
-                    )["Value"].fillna(0).sum()
+                    sum_others = _sum_value_column(st.session_state.get("single_fix_others"))
 
                 fixed_month = (
                     float(st.session_state.get("single_fix_labor_month", 0.0))
@@ -5078,8 +5594,8 @@ def ui_single():
         if currency_out_pay == "USD":
             pay_fx, pay_sym = 1.0, "US$"
         else:
-            pay_fx = float(st.session_state.get("single_fx", DEFAULTS.get("usd_to_local", 5.57)))
-            pay_sym = st.session_state.get("single_local_sym", DEFAULTS.get("local_symbol", "R$"))
+            pay_fx = float(st.session_state.get("single_fx", DEFAULTS.usd_to_local))
+            pay_sym = st.session_state.get("single_local_sym", DEFAULTS.local_symbol)
 
         unit_lbl_pay = P.get("unit_lbl", unit_label_short(get_unit()))
         fixed_per_unit_pay = float(P["be"].get("fixed_per_unit", 0.0))
@@ -5088,12 +5604,9 @@ def ui_single():
         if fix_mode_val.startswith("monthly"):
             sum_others_pay = 0.0
             if st.session_state.get("single_fix_others"):
-                sum_others_pay = ensure_df(
-                    st.session_state.get("single_fix_others", []),
-                    ["Name", "Value"],
-                )["Value"].fillna(0).sum()
+                sum_others_pay = _sum_value_column(st.session_state.get("single_fix_others"))
             monthly_units_pay = float(
-                st.session_state.get("single_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30800.0))
+                st.session_state.get("single_fix_prod_month_units", DEFAULTS.prod_month_units)
             )
             fixed_month_pay = (
                 float(st.session_state.get("single_fix_labor_month", 0.0))
@@ -5105,10 +5618,10 @@ def ui_single():
             depreciation_month_pay = float(st.session_state.get("single_fix_depr_month", 0.0))
         else:
             monthly_units_pay = float(
-                st.session_state.get("single_fix_prod_month_units", DEFAULTS.get("prod_month_units", 30800.0))
+                st.session_state.get("single_fix_prod_month_units", DEFAULTS.prod_month_units)
             )
             if monthly_units_pay <= 0:
-                monthly_units_pay = DEFAULTS.get("prod_month_units", 30800.0)
+                monthly_units_pay = DEFAULTS.prod_month_units
             fixed_month_pay = fixed_per_unit_pay * monthly_units_pay
             depreciation_month_pay = 0.0
 
@@ -5231,8 +5744,8 @@ def ui_compare():
     avail.update({k for k in (mlm2B or {}).keys() if k})
 
     # Tem JPG de preview em A ou B?
-    has_prev = any(re.search(r"preview", j, re.I) for j in (jpgsA or [])) or \
-            any(re.search(r"preview", j, re.I) for j in (jpgsB or []))
+    has_prev = any(_PREVIEW_RE.search(j) for j in (jpgsA or [])) or \
+            any(_PREVIEW_RE.search(j) for j in (jpgsB or []))
     if has_prev:
         avail.add("Preview")
 
@@ -5491,7 +6004,7 @@ def ui_compare():
         fx1, fx2, fx3, fx4 = st.columns(4)
         fix_labor_month = fx1.number_input(
             "Fixed labor — USD/month",
-            value=float(st.session_state.get("fix_labor_month", DEFAULTS["fix_labor_month"])),
+            value=float(st.session_state.get("fix_labor_month", DEFAULTS.fix_labor_month)),
             min_value=0.0,
             step=50.0,
             help="Salaries or fixed staff per month.",
@@ -5499,7 +6012,7 @@ def ui_compare():
         )
         fix_leasing_month = fx2.number_input(
             "Leasing/Subscriptions — USD/month",
-            value=float(st.session_state.get("fix_leasing_month", DEFAULTS["fix_leasing_month"])),
+            value=float(st.session_state.get("fix_leasing_month", DEFAULTS.fix_leasing_month)),
             min_value=0.0,
             step=50.0,
             help="Printer leasing, RIP, contracts, etc.",
@@ -5507,7 +6020,7 @@ def ui_compare():
         )
         fix_capex_month = fx3.number_input(
             "Depreciation — USD/month",
-            value=float(st.session_state.get("fix_capex_month", DEFAULTS["fix_capex_month"])),
+            value=float(st.session_state.get("fix_capex_month", DEFAULTS.fix_capex_month)),
             min_value=0.0,
             step=50.0,
             help="Monthly CAPEX (depreciation).",
@@ -5515,7 +6028,7 @@ def ui_compare():
         )
         fix_indust_month = fx4.number_input(
             "Overheads — USD/month",
-            value=float(st.session_state.get("fix_indust_month", DEFAULTS["fix_indust_month"])),
+            value=float(st.session_state.get("fix_indust_month", DEFAULTS.fix_indust_month)),
             min_value=0.0,
             step=50.0,
             help="Base energy, insurance, rent, maintenance, etc.",
@@ -5534,7 +6047,7 @@ def ui_compare():
             + fix_leasing_month
             + fix_capex_month
             + fix_indust_month
-            + float(ensure_df(fix_others_df)["Amount (USD)"].fillna(0).sum())
+            + _sum_value_column(fix_others_df, "Amount (USD)")
         )
 
 
@@ -5573,14 +6086,14 @@ def ui_compare():
         cfg2, cfg3 = st.columns([1, 1])
         local_symbol = cfg2.text_input(
             "Local currency symbol",
-            value=st.session_state.get("local_symbol", DEFAULTS["local_symbol"]),
+            value=st.session_state.get("local_symbol", DEFAULTS.local_symbol),
             help="Ex.: R$, €",
             key="cmp_local_sym",
         )
         usd_to_local = cfg3.number_input(
             "USD → Local (FX)",
             min_value=0.0,
-            value=float(st.session_state.get("usd_to_local", DEFAULTS["usd_to_local"])),
+            value=float(st.session_state.get("usd_to_local", DEFAULTS.usd_to_local)),
             step=0.01,
             key="cmp_fx",
         )
@@ -5590,19 +6103,19 @@ def ui_compare():
 
         v1, v2, v3 = st.columns(3)
         ink_color_per_l = v1.number_input(
-            "Color ink ($/L)", value=float(st.session_state.get("ink_color_per_l", DEFAULTS["ink_color_per_l"])), min_value=0.0, step=1.0, key="cmp_ink_c"
+            "Color ink ($/L)", value=float(st.session_state.get("ink_color_per_l", DEFAULTS.ink_color_per_l)), min_value=0.0, step=1.0, key="cmp_ink_c"
         )
         ink_white_per_l = v2.number_input(
-            "White ink ($/L)", value=float(st.session_state.get("ink_white_per_l", DEFAULTS["ink_white_per_l"])), min_value=0.0, step=1.0, key="cmp_ink_w"
+            "White ink ($/L)", value=float(st.session_state.get("ink_white_per_l", DEFAULTS.ink_white_per_l)), min_value=0.0, step=1.0, key="cmp_ink_w"
         )
         fof_per_l = v3.number_input(
-            "FOF / Pretreat ($/L)", value=float(st.session_state.get("fof_per_l", DEFAULTS["fof_per_l"])), min_value=0.0, step=1.0, key="cmp_fof"
+            "FOF / Pretreat ($/L)", value=float(st.session_state.get("fof_per_l", DEFAULTS.fof_per_l)), min_value=0.0, step=1.0, key="cmp_fof"
         )
 
         mv1, _mv2 = st.columns(2)
         fabric_per_unit = mv1.number_input(
             f"Substrate ({per_unit(UNIT)})",
-            value=float(st.session_state.get("fabric_per_unit", DEFAULTS["fabric_per_unit"])),
+            value=float(st.session_state.get("fabric_per_unit", DEFAULTS.fabric_per_unit)),
             min_value=0.0,
             step=0.10,
             key="cmp_fabric",
@@ -5704,8 +6217,9 @@ def ui_compare():
                     cols=["Name", "Value"],
                 )
                 df_vars = st.data_editor(_vars_input, num_rows="dynamic", use_container_width=True, key=f"{key_prefix}_vars_editor")
-                st.session_state[f"{key_prefix}_other_vars"] = ensure_df(df_vars, ["Name", "Value"]).to_dict(orient="records")
-                others_var_sum = float(ensure_df(df_vars, ["Name", "Value"])['Value'].fillna(0).sum()) + float(labor_var_per_unit)
+                _vars_recs = ensure_df(df_vars, ["Name", "Value"]).to_dict(orient="records")
+                st.session_state[f"{key_prefix}_other_vars"] = _vars_recs
+                others_var_sum = _sum_value_column(_vars_recs) + float(labor_var_per_unit)
 
                 fixed_default = st.session_state.get("cmp_fixed_per_unit", st.session_state.get("fixed_per_unit", 0.0))
                 fixed_per_unit_used = st.number_input(
@@ -5760,11 +6274,11 @@ def ui_compare():
                         float(st.session_state.get(f"{key_prefix}_waste", 2.0)),
                         speed,
                         mlmap_use,
-                        float(st.session_state.get("cmp_ink_c", DEFAULTS["ink_color_per_l"])),
-                        float(st.session_state.get("cmp_ink_w", DEFAULTS["ink_white_per_l"])),
-                        float(st.session_state.get("cmp_fof", DEFAULTS["fof_per_l"])),
-                        float(st.session_state.get("cmp_fabric", DEFAULTS["fabric_per_unit"])),
-                        float(ensure_df(st.session_state.get(f"{key_prefix}_other_vars", [{"Name":"—","Value":0.0}]), ["Name","Value"])["Value"].fillna(0).sum()) + float(st.session_state.get(f"{key_prefix}_lab_h", 0.0)) / max(1e-9, speed),
+                        float(st.session_state.get("cmp_ink_c", DEFAULTS.ink_color_per_l)),
+                        float(st.session_state.get("cmp_ink_w", DEFAULTS.ink_white_per_l)),
+                        float(st.session_state.get("cmp_fof", DEFAULTS.fof_per_l)),
+                        float(st.session_state.get("cmp_fabric", DEFAULTS.fabric_per_unit)),
+                        _sum_value_column(st.session_state.get(f"{key_prefix}_other_vars")) + float(st.session_state.get(f"{key_prefix}_lab_h", 0.0)) / max(1e-9, speed),
                         0.0,
                         float(st.session_state.get(f"{key_prefix}_fixed_unit", st.session_state.get("cmp_fixed_per_unit", st.session_state.get("fixed_per_unit", 0.0)))),
                     )
@@ -5921,9 +6435,9 @@ def ui_batch():
         total = total_ml_per_m2_from_map(mlmap_use)
         cml = wml = fml = 0.0
         for k,v in (mlmap_use or {}).items():
-            low = (k or '').strip().lower()
-            if low in CHANNELS_WHITE: wml += float(v)
-            elif low in CHANNELS_FOF: fml += float(v)
+            cls = channel_class(k)
+            if cls == 1: wml += float(v)
+            elif cls == 2: fml += float(v)
             else: cml += float(v)
         try:
             w_xml_def, h_xml_def, _area_xml = get_xml_dims_m(xml_bytes)